@@ -0,0 +1,163 @@
+"""
+query_load.py - Load benchmark for /query_chunks against a local fake Gemini
+
+Runs the real query router in-process (httpx ASGITransport, no network) with
+the Gemini client and the Chroma collection replaced by fakes that only add
+latency. It compares:
+
+    sync   a blocking `def` endpoint making the same three LLM round trips
+           (plan, embed, answer) - what every route looked like before
+    async  the real async /query_chunks
+
+Usage:
+    python -m benchmarks.query_load --requests 400 --concurrency 200 --latency 0.2
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+from types import SimpleNamespace
+
+
+class _FakeModels:
+    """Blocking fake of client.models."""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    def generate_content(self, model, contents, config=None):
+        time.sleep(self.latency)
+        return _fake_generate(contents, config)
+
+    def embed_content(self, model, contents, config=None):
+        time.sleep(self.latency)
+        return _fake_embed(contents)
+
+
+class _FakeAsyncModels:
+    """Async fake of client.aio.models."""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    async def generate_content(self, model, contents, config=None):
+        await asyncio.sleep(self.latency)
+        return _fake_generate(contents, config)
+
+    async def embed_content(self, model, contents, config=None):
+        await asyncio.sleep(self.latency)
+        return _fake_embed(contents)
+
+
+def _fake_generate(contents, config):
+    if config is not None and getattr(config, "response_mime_type", None) == "application/json":
+        question = contents.rsplit("User question:", 1)[-1].strip()
+        return SimpleNamespace(text=json.dumps({
+            "query_dev": question,
+            "question": question,
+            "answer_type": "short",
+            "history_need": "no",
+        }))
+    return SimpleNamespace(text="A short English answer.")
+
+
+def _fake_embed(contents):
+    return SimpleNamespace(embeddings=[SimpleNamespace(values=[0.0] * 768) for _ in contents])
+
+
+class _FakeCollection:
+    def query(self, query_embeddings, n_results, where=None, include=None):
+        n = min(n_results, 4)
+        return {
+            "documents": [["chunk one", "chunk two", "chunk three", "chunk four"][:n]],
+            "metadatas": [[{"video_id": "bench", "chunk_id": 2 * i} for i in range(n)]],
+            "embeddings": [[[float(i == j) for j in range(768)] for i in range(n)]],
+        }
+
+
+def build_app(latency: float):
+    from fastapi import FastAPI
+    from query import query, planner, answer
+    from embedding import chunk_utils
+    from chat_db import summary
+
+    fake_client = SimpleNamespace(
+        models=_FakeModels(latency),
+        aio=SimpleNamespace(models=_FakeAsyncModels(latency)),
+    )
+    planner.client = fake_client
+    answer.client = fake_client
+    chunk_utils.client = fake_client
+    summary.client = fake_client
+    query._get_collection = lambda collection_name, persist_dir, session_id: _FakeCollection()
+
+    app = FastAPI()
+    app.include_router(query.router)
+
+    @app.get("/bench/sync_query")
+    def sync_query(q: str):
+        # Same round trips as /query_chunks, on blocking calls
+        fake_client.models.generate_content(model="", contents=q)
+        fake_client.models.embed_content(model="", contents=[q])
+        _FakeCollection().query(query_embeddings=[[0.0] * 768], n_results=4)
+        resp = fake_client.models.generate_content(model="", contents=q)
+        return {"answer": resp.text}
+
+    return app
+
+
+async def run(app, path: str, n_requests: int, concurrency: int) -> dict:
+    import httpx
+
+    sem = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=None) as http:
+        async def one(i: int):
+            nonlocal errors
+            async with sem:
+                t0 = time.perf_counter()
+                r = await http.get(path, params={"q": f"question number {i} {path}"})
+                latencies.append(time.perf_counter() - t0)
+                if r.status_code != 200:
+                    errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(n_requests)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "path": path,
+        "requests": n_requests,
+        "concurrency": concurrency,
+        "errors": errors,
+        "seconds": round(elapsed, 2),
+        "requests_per_s": round(n_requests / elapsed, 1),
+        "p50_ms": round(1000 * latencies[len(latencies) // 2]),
+        "p95_ms": round(1000 * latencies[int(len(latencies) * 0.95) - 1]),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load benchmark for /query_chunks against a fake Gemini")
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.2, help="Seconds per fake Gemini call")
+    args = parser.parse_args()
+
+    # Keep the chat / embedding cache databases out of the working tree;
+    # the Gemini clients are replaced, but need a key to be constructed
+    os.chdir(tempfile.mkdtemp(prefix="query_load_"))
+    os.environ.setdefault("GOOGLE_API_KEY", "benchmark-fake-key")
+
+    app = build_app(args.latency)
+    for path in ("/bench/sync_query", "/query_chunks"):
+        print(json.dumps(asyncio.run(run(app, path, args.requests, args.concurrency))))
+
+
+if __name__ == "__main__":
+    main()
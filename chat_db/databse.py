@@ -1,104 +1,252 @@
 # database.py
+import atexit
+import queue
 import sqlite3
+import threading
 from datetime import datetime
-from typing import Optional, List, Tuple
+from typing import Dict, Optional, List, Tuple
+from youtube.config import (
+    DEFAULT_SESSION_ID,
+    CHAT_DB_BUSY_TIMEOUT_MS,
+    CHAT_WRITE_BATCH_MAX,
+    CHAT_WRITE_QUEUE_MAX,
+)
 
 # GLOBAL DATABASE NAME
 DB_NAME = "chat_history.db"
 
+# One connection per (thread, database): sqlite3 connections must stay on the
+# thread that opened them, and a long-lived connection keeps its prepared
+# statement cache, so repeated queries skip the SQL compile step
+_local = threading.local()
+
+def _connect(db_name: str = DB_NAME) -> sqlite3.Connection:
+    """Return this thread's connection to db_name, opening it on first use."""
+    conns = getattr(_local, "conns", None)
+    if conns is None:
+        conns = _local.conns = {}
+    conn = conns.get(db_name)
+    if conn is None:
+        conn = sqlite3.connect(db_name, timeout=CHAT_DB_BUSY_TIMEOUT_MS / 1000)
+        # WAL: readers don't block the writer and commits skip a full fsync
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conns[db_name] = conn
+    return conn
+
 def create_database(db_name: str = DB_NAME):
     """Create the database and table if they don't exist."""
     try:
-        conn = sqlite3.connect(db_name)
+        conn = _connect(db_name)
         cursor = conn.cursor()
-        
+
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS chat_records (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 role TEXT NOT NULL,
                 output TEXT NOT NULL,
-                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+                session_id TEXT NOT NULL DEFAULT 'default'
+            )
+        ''')
+        # Databases created before chat history was scoped by session
+        columns = {row[1] for row in cursor.execute("PRAGMA table_info(chat_records)")}
+        if "session_id" not in columns:
+            cursor.execute("ALTER TABLE chat_records ADD COLUMN session_id TEXT NOT NULL DEFAULT 'default'")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_chat_records_session ON chat_records(session_id, id)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_chat_records_timestamp ON chat_records(timestamp)")
+        # Conversation summary per session, keyed by the newest record it covers
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS chat_summaries (
+                session_id TEXT PRIMARY KEY,
+                last_id INTEGER NOT NULL,
+                summary TEXT NOT NULL,
+                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
             )
         ''')
-        
+
         conn.commit()
-        conn.close()
         print(f"Database '{db_name}' created/verified successfully.")
-    
+
     except sqlite3.Error as e:
         print(f"Error creating database: {e}")
 
-def append_data(role: str, output: str, db_name: str = DB_NAME) -> bool:
-    """Append a new record to the database."""
+def append_data(role: str, output: str, session_id: str = DEFAULT_SESSION_ID, db_name: str = DB_NAME) -> bool:
+    """Append a new record to the session's chat history."""
     try:
-        conn = sqlite3.connect(db_name)
+        conn = _connect(db_name)
         cursor = conn.cursor()
-        
+
         cursor.execute('''
-            INSERT INTO chat_records (role, output)
-            VALUES (?, ?)
-        ''', (role, output))
-        
+            INSERT INTO chat_records (role, output, session_id)
+            VALUES (?, ?, ?)
+        ''', (role, output, session_id))
+
         conn.commit()
         record_id = cursor.lastrowid
-        conn.close()
-        
+
         print(f"Record added successfully with ID: {record_id}")
         return True
-    
+
     except sqlite3.Error as e:
         print(f"Error appending data: {e}")
         return False
 
-def delete_all_records(db_name: str = DB_NAME) -> bool:
-    """Delete all records from the database table."""
+# Batched background writes: queue_append() returns immediately and a single
+# writer thread inserts everything queued so far in one transaction
+_write_queue: "queue.Queue" = queue.Queue(maxsize=CHAT_WRITE_QUEUE_MAX)
+_writer_lock = threading.Lock()
+_writer: Optional[threading.Thread] = None
+# Queued, not yet committed records per (db_name, session_id)
+_pending: Dict[Tuple[str, str], int] = {}
+_pending_lock = threading.Lock()
+
+def _write_batches():
+    """
+    Writer thread: drain the queue and insert each batch with executemany.
+
+    Queue items are records (db_name, role, output, session_id) or
+    threading.Event markers, which are set once everything queued before
+    them is committed.
+    """
+    while True:
+        batch = [_write_queue.get()]
+        while len(batch) < CHAT_WRITE_BATCH_MAX:
+            try:
+                batch.append(_write_queue.get_nowait())
+            except queue.Empty:
+                break
+
+        markers = [item for item in batch if isinstance(item, threading.Event)]
+        records = [item for item in batch if not isinstance(item, threading.Event)]
+        by_db = {}
+        for db_name, role, output, session_id in records:
+            by_db.setdefault(db_name, []).append((role, output, session_id))
+
+        try:
+            for db_name, rows in by_db.items():
+                conn = _connect(db_name)
+                conn.executemany('''
+                    INSERT INTO chat_records (role, output, session_id)
+                    VALUES (?, ?, ?)
+                ''', rows)
+                conn.commit()
+        except sqlite3.Error as e:
+            print(f"Error writing {len(records)} queued records: {e}")
+        finally:
+            with _pending_lock:
+                for db_name, _, _, session_id in records:
+                    key = (db_name, session_id)
+                    _pending[key] -= 1
+                    if not _pending[key]:
+                        del _pending[key]
+            for marker in markers:
+                marker.set()
+
+def _ensure_writer():
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = threading.Thread(target=_write_batches, name="chat-db-writer", daemon=True)
+                _writer.start()
+
+def queue_append(role: str, output: str, session_id: str = DEFAULT_SESSION_ID, db_name: str = DB_NAME) -> None:
+    """
+    Queue a record for the background writer and return without touching the database.
+
+    Records are written in order. Reads and deletes of a session through this
+    module wait for that session's queued records first, so callers always
+    see their own writes. Only blocks when CHAT_WRITE_QUEUE_MAX records are
+    already waiting, i.e. when appends outpace the disk.
+    """
+    _ensure_writer()
+    with _pending_lock:
+        _pending[(db_name, session_id)] = _pending.get((db_name, session_id), 0) + 1
+    _write_queue.put((db_name, role, output, session_id))
+
+def flush_writes(session_id: Optional[str] = None, db_name: str = DB_NAME) -> None:
+    """
+    Block until the records queued so far for session_id (any session when
+    None) are written.
+
+    Waits on a marker queued behind them, not for the queue to drain, so
+    appends made meanwhile by other requests never extend the wait.
+    """
+    with _pending_lock:
+        if session_id is None:
+            pending = bool(_pending)
+        else:
+            pending = (db_name, session_id) in _pending
+    if not pending:
+        return
+    _ensure_writer()
+    marker = threading.Event()
+    _write_queue.put(marker)
+    marker.wait()
+
+# Queued chat records must not be lost on a clean shutdown
+atexit.register(flush_writes)
+
+def delete_all_records(session_id: Optional[str] = None, db_name: str = DB_NAME) -> bool:
+    """Delete all records of a session, or of every session when session_id is None."""
     try:
-        conn = sqlite3.connect(db_name)
+        flush_writes(session_id, db_name)
+        conn = _connect(db_name)
         cursor = conn.cursor()
-        
-        cursor.execute('DELETE FROM chat_records')
-        deleted_count = cursor.rowcount
-        
+
+        if session_id is None:
+            cursor.execute('DELETE FROM chat_records')
+            deleted_count = cursor.rowcount
+            cursor.execute('DELETE FROM chat_summaries')
+        else:
+            cursor.execute('DELETE FROM chat_records WHERE session_id = ?', (session_id,))
+            deleted_count = cursor.rowcount
+            cursor.execute('DELETE FROM chat_summaries WHERE session_id = ?', (session_id,))
+
         conn.commit()
-        conn.close()
-        
+
         print(f"All records deleted successfully. Total deleted: {deleted_count}")
         return True
-    
+
     except sqlite3.Error as e:
         print(f"Error deleting records: {e}")
         return False
 
-def get_all_records(db_name: str = DB_NAME) -> List[Tuple]:
-    """Retrieve all records from the database."""
+def get_all_records(session_id: str = DEFAULT_SESSION_ID, db_name: str = DB_NAME) -> List[Tuple]:
+    """Retrieve all records of a session as (id, role, output, timestamp)."""
     try:
-        conn = sqlite3.connect(db_name)
+        flush_writes(session_id, db_name)
+        conn = _connect(db_name)
         cursor = conn.cursor()
-        
-        cursor.execute('SELECT * FROM chat_records ORDER BY id')
+
+        cursor.execute(
+            'SELECT id, role, output, timestamp FROM chat_records WHERE session_id = ? ORDER BY id',
+            (session_id,),
+        )
         records = cursor.fetchall()
-        
-        conn.close()
+
         return records
-    
+
     except sqlite3.Error as e:
         print(f"Error retrieving records: {e}")
         return []
 
-def get_last_n_records(n: int, db_name: str = DB_NAME) -> List[Tuple]:
-    """Retrieve the last N records from the database."""
+def get_last_n_records(n: int, session_id: str = DEFAULT_SESSION_ID, db_name: str = DB_NAME) -> List[Tuple]:
+    """Retrieve the last N records of a session as (id, role, output, timestamp)."""
     try:
-        conn = sqlite3.connect(db_name)
+        flush_writes(session_id, db_name)
+        conn = _connect(db_name)
         cursor = conn.cursor()
 
         cursor.execute('''
-            SELECT * FROM chat_records
+            SELECT id, role, output, timestamp FROM chat_records
+            WHERE session_id = ?
             ORDER BY id DESC
             LIMIT ?
-        ''', (n,))
+        ''', (session_id, n))
 
         records = cursor.fetchall()
-        conn.close()
 
         # To get them in chronological order (oldest first), reverse the list:
         return list(reversed(records))
@@ -107,5 +255,37 @@ def get_last_n_records(n: int, db_name: str = DB_NAME) -> List[Tuple]:
         print(f"Error retrieving last {n} records: {e}")
         return []
 
+def get_summary(session_id: str = DEFAULT_SESSION_ID, db_name: str = DB_NAME) -> Optional[Tuple[int, str]]:
+    """Return the stored (last_id, summary) of a session, or None."""
+    try:
+        row = _connect(db_name).execute(
+            'SELECT last_id, summary FROM chat_summaries WHERE session_id = ?',
+            (session_id,),
+        ).fetchone()
+        return tuple(row) if row else None
+
+    except sqlite3.Error as e:
+        print(f"Error retrieving summary: {e}")
+        return None
+
+def put_summary(last_id: int, summary: str, session_id: str = DEFAULT_SESSION_ID, db_name: str = DB_NAME) -> bool:
+    """Store the summary of a session covering the records up to last_id."""
+    try:
+        conn = _connect(db_name)
+        conn.execute('''
+            INSERT INTO chat_summaries (session_id, last_id, summary, updated_at)
+            VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+            ON CONFLICT(session_id) DO UPDATE SET
+                last_id = excluded.last_id,
+                summary = excluded.summary,
+                updated_at = excluded.updated_at
+        ''', (session_id, last_id, summary))
+        conn.commit()
+        return True
+
+    except sqlite3.Error as e:
+        print(f"Error storing summary: {e}")
+        return False
+
 # Initialize database on module import
 create_database()
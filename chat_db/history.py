@@ -1,12 +1,15 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Query
 from chat_db.databse import get_all_records 
+from youtube.config import DEFAULT_SESSION_ID, SESSION_ID_PATTERN
 
  
 router = APIRouter()  # FIX: Added parentheses to instantiate
 @router.get("/history")  # FIX: Corrected spelling from /hisotry to /history
-def history():
-     """Get all chat history records."""
-     records = get_all_records()  # FIX: Actually call the function
+def history(
+     session_id: str = Query(DEFAULT_SESSION_ID, pattern=SESSION_ID_PATTERN, description="Chat session id"),
+):
+     """Get all chat history records of a session."""
+     records = get_all_records(session_id)  # FIX: Actually call the function
      
      # Format the response
      formatted_records = []
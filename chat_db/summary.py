@@ -1,5 +1,16 @@
-from fastapi import APIRouter
-from chat_db.databse import get_last_n_records   # verify the import path
+from fastapi import APIRouter, Query
+from fastapi.concurrency import run_in_threadpool
+from typing import Dict, List, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import threading
+from chat_db.databse import get_last_n_records, get_summary, put_summary   # verify the import path
+from youtube.config import (
+    DEFAULT_SESSION_ID,
+    SESSION_ID_PATTERN,
+    SUMMARY_RECORDS,
+    SUMMARY_REFRESH_WORKERS,
+)
 
 from google import genai
 from google.genai import types
@@ -15,12 +26,57 @@ client = genai.Client(api_key=GOOGLE_API_KEY)
 
 router = APIRouter()
 
-@router.get("/summary")
-def summary():
-    d = get_last_n_records(4)  # Fetch inside the function
-    formatted_list = [f"{row[1]} - {row[2]}" for row in d]
+# Background summary refreshes, scheduled after each bot answer
+_refresh_pool = ThreadPoolExecutor(max_workers=SUMMARY_REFRESH_WORKERS, thread_name_prefix="summary-refresh")
+_refresh_lock = threading.Lock()
+_scheduled = set()
+# One refresh at a time per session, so overlapping refreshes don't both call Gemini.
+# session_id -> [lock, number of holders and waiters]; dropped when the last one leaves
+_session_locks: Dict[str, list] = {}
+
+
+def _format_records(records: List[Tuple]) -> List[str]:
+    return [f"{row[1]} - {row[2]}" for row in records]
+
+
+def recent_conversation(n: int = 4, session_id: str = DEFAULT_SESSION_ID) -> str:
+    """The last n chat records of a session as "role - output" lines (no Gemini call)."""
+    return "\n".join(_format_records(get_last_n_records(n, session_id)))
 
-    prompt = f"""
+
+def cached_summary(session_id: str = DEFAULT_SESSION_ID) -> Optional[str]:
+    """Stored summary of the session if it covers the newest chat record, else None (no Gemini call)."""
+    stored = get_summary(session_id)
+    if stored is None:
+        return None
+    d = get_last_n_records(1, session_id)
+    if d and stored[0] == d[-1][0]:
+        return stored[1]
+    return None
+
+
+def _pending_update(session_id: str) -> Tuple[Optional[str], List[Tuple]]:
+    """
+    (stored summary, recent records it does not cover yet).
+
+    No records means the stored summary is up to date.
+    """
+    stored = get_summary(session_id)
+    d = get_last_n_records(SUMMARY_RECORDS, session_id)
+    if stored is None:
+        return None, d
+    return stored[1], [r for r in d if r[0] > stored[0]]
+
+
+def _summary_prompt(formatted_list: List[str], previous: Optional[str] = None) -> str:
+    earlier = ""
+    if previous:
+        earlier = f"""
+    Here is the summary of the conversation before these interactions; update it
+    with the new interactions, keeping what is still relevant:
+    {previous}
+    """
+    return f"""
     The following are the most recent user–assistant interactions.
     Your task is to produce a short context summary that captures:
     • The main subject being discussed (focus on WHAT the conversation is about)
@@ -31,14 +87,79 @@ def summary():
 
     If future questions refer to “he”, “they”, “what is it?”, or “this”, the summary should help identify what the user is referring to.
     Return only a single paragraph summary.
-
+    {earlier}
     Here is the recent conversation:
     {formatted_list}
     """
 
+
+def summary(session_id: str = DEFAULT_SESSION_ID):
+    """
+    Blocking summary of the session's conversation (for sync callers).
+
+    Returns the stored summary when it covers the newest record; otherwise
+    folds the records it misses into it with one Gemini call and stores it.
+    """
+    previous, new = _pending_update(session_id)
+    if not new:
+        return {"summary": previous or ""}
+
     resp = client.models.generate_content(
         model="gemini-2.0-flash",
-        contents=prompt
+        contents=_summary_prompt(_format_records(new), previous)
     )
 
+    put_summary(new[-1][0], resp.text, session_id)
     return  {"summary":resp.text}
+
+
+@contextmanager
+def _session_lock(session_id: str):
+    """Hold the session's refresh lock; the entry is removed once nobody uses it."""
+    with _refresh_lock:
+        entry = _session_locks.setdefault(session_id, [threading.Lock(), 0])
+        entry[1] += 1
+    try:
+        with entry[0]:
+            yield
+    finally:
+        with _refresh_lock:
+            entry[1] -= 1
+            if not entry[1]:
+                del _session_locks[session_id]
+
+
+def _refresh_and_get(session_id: str) -> dict:
+    """summary() under the session's lock, so it never races a background refresh."""
+    with _session_lock(session_id):
+        return summary(session_id)
+
+
+def _refresh(session_id: str) -> None:
+    with _refresh_lock:
+        _scheduled.discard(session_id)
+    try:
+        _refresh_and_get(session_id)
+    except Exception as e:
+        print(f"Error refreshing summary of session {session_id}: {e}")
+
+
+def schedule_summary_refresh(session_id: str = DEFAULT_SESSION_ID) -> None:
+    """
+    Bring the stored summary up to date in the background, so query time only
+    reads it. Call after appending a bot answer; a refresh already waiting for
+    the session covers the new records too.
+    """
+    with _refresh_lock:
+        if session_id in _scheduled:
+            return
+        _scheduled.add(session_id)
+    _refresh_pool.submit(_refresh, session_id)
+
+
+@router.get("/summary")
+async def summary_endpoint(
+    session_id: str = Query(DEFAULT_SESSION_ID, pattern=SESSION_ID_PATTERN, description="Chat session id"),
+):
+    # Same locked path as the background refresh: at most one Gemini call per new record
+    return await run_in_threadpool(_refresh_and_get, session_id)
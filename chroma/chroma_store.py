@@ -1,103 +1,618 @@
 """
 chroma_store.py - Store chunk embeddings into ChromaDB (new client API)
+
+Storage goes through the VectorStore interface; VECTOR_BACKEND selects
+ChromaDB or the in-process NumPy exact-search store.
 """
-from typing import List, Dict, Any
+from abc import ABC, abstractmethod
+from typing import List, Dict, Any, Iterable, Optional, Tuple
 from pathlib import Path
+import json
+import os
+import re
+import threading
 import chromadb
+import numpy as np
+from youtube.config import (
+    CHROMA_ADD_BATCH_SIZE,
+    VECTOR_BACKEND,
+    VECTOR_BACKENDS,
+    NUMPY_STORE_PERSIST,
+    DEFAULT_SESSION_ID,
+    SESSION_ID_PATTERN,
+    COLLECTION_NAME_PATTERN,
+)
 
-def _make_chroma_client(persist: bool = True, persist_dir: str = "chromadb_store"):
+class VectorStore(ABC):
     """
-    Create a Chroma client.
+    Minimal collection interface shared by the vector backends.
 
-    If persist=True: use PersistentClient (data saved on disk).
-    If persist=False: use in-memory Client (data lost when process stops).
+    Method signatures and result shapes follow a Chroma collection, so
+    callers work unchanged on either backend.
     """
-    persist_path = Path(persist_dir)
-    persist_path.mkdir(parents=True, exist_ok=True)
 
-    if persist:
-        return chromadb.PersistentClient(path=str(persist_path))
-    else:
-        return chromadb.Client()
-    
-    
-def store_embeddings_in_chroma(
-    all_data: List[Dict[str, Any]],
-    collection_name: str = "video_chunks",
+    @abstractmethod
+    def upsert(self, ids: List[str], documents: List[str], embeddings: List[List[float]],
+               metadatas: List[Dict[str, Any]]) -> None:
+        ...
+
+    @abstractmethod
+    def query(self, query_embeddings: List[List[float]], n_results: int = 4,
+              where: Optional[Dict[str, Any]] = None,
+              include: Optional[List[str]] = None) -> Dict[str, List[list]]:
+        """
+        Return {"ids", "documents", "metadatas", "distances"}, one list per query
+        embedding; "embeddings" too when listed in include.
+        """
+
+    @abstractmethod
+    def get(self, where: Optional[Dict[str, Any]] = None, include: Optional[List[str]] = None) -> Dict[str, list]:
+        """Return {"ids", "documents", "metadatas"} of the matching entries."""
+
+    @abstractmethod
+    def delete(self, ids: List[str]) -> None:
+        ...
+
+    @abstractmethod
+    def count(self) -> int:
+        ...
+
+    def persist(self) -> None:
+        """Write pending changes to disk; a no-op for backends that persist on every write."""
+
+
+class ChromaVectorStore(VectorStore):
+    """VectorStore over a ChromaDB collection."""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def upsert(self, ids, documents, embeddings, metadatas):
+        self.collection.upsert(ids=ids, documents=documents, embeddings=embeddings, metadatas=metadatas)
+
+    def query(self, query_embeddings, n_results=4, where=None, include=None):
+        return self.collection.query(
+            query_embeddings=query_embeddings,
+            n_results=n_results,
+            where=where,
+            include=include or ["metadatas", "documents", "distances"],
+        )
+
+    def get(self, where=None, include=None):
+        return self.collection.get(where=where, include=include or ["metadatas", "documents"])
+
+    def delete(self, ids):
+        if ids:
+            self.collection.delete(ids=ids)
+
+    def count(self):
+        return self.collection.count()
+
+
+def _matches(metadata: Dict[str, Any], where: Optional[Dict[str, Any]]) -> bool:
+    """Evaluate the Chroma where subset used here: equality, $eq, $in and $and."""
+    if not where:
+        return True
+    for key, cond in where.items():
+        if key == "$and":
+            if not all(_matches(metadata, c) for c in cond):
+                return False
+        elif isinstance(cond, dict):
+            value = metadata.get(key)
+            if "$eq" in cond and value != cond["$eq"]:
+                return False
+            if "$in" in cond and value not in cond["$in"]:
+                return False
+        elif metadata.get(key) != cond:
+            return False
+    return True
+
+
+class NumpyVectorStore(VectorStore):
+    """
+    Exact-search VectorStore on a contiguous float32 matrix.
+
+    A query is one matmul plus an argpartition over squared L2 distances
+    (Chroma's default space), so rankings match the Chroma backend. With a
+    path, persist() saves the matrix to <path>.npy and ids/documents/metadata
+    to <path>.json; upserts and deletes only change memory, so a bulk load
+    writes the files once instead of once per batch. Filters on video_id are served from a
+    per-video row index, so filtered queries only touch that video's rows.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self._lock = threading.RLock()
+        self._ids: List[str] = []
+        self._index: Dict[str, int] = {}
+        self._documents: List[str] = []
+        self._metadatas: List[Dict[str, Any]] = []
+        self._matrix = np.zeros((0, 0), dtype=np.float32)
+        self._sq_norms = np.zeros(0, dtype=np.float32)
+        # video_id -> rows, rebuilt on first use after a change
+        self._video_rows: Optional[Dict[Any, List[int]]] = None
+        # Changes not yet written by persist()
+        self._dirty = False
+        if path and os.path.exists(path + ".npy"):
+            self._load()
+
+    def _load(self):
+        self._matrix = np.ascontiguousarray(np.load(self.path + ".npy"), dtype=np.float32)
+        with open(self.path + ".json", encoding="utf-8") as f:
+            meta = json.load(f)
+        self._ids = meta["ids"]
+        self._documents = meta["documents"]
+        self._metadatas = meta["metadatas"]
+        self._index = {i: n for n, i in enumerate(self._ids)}
+        self._sq_norms = np.einsum("ij,ij->i", self._matrix, self._matrix)
+
+    def persist(self):
+        with self._lock:
+            if self.path and self._dirty:
+                self._save()
+            self._dirty = False
+
+    def _save(self):
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        # Write then rename, so a crash never leaves half a file behind
+        with open(self.path + ".npy.tmp", "wb") as f:
+            np.save(f, self._matrix)
+        with open(self.path + ".json.tmp", "w", encoding="utf-8") as f:
+            json.dump({"ids": self._ids, "documents": self._documents, "metadatas": self._metadatas},
+                      f, ensure_ascii=False)
+        os.replace(self.path + ".npy.tmp", self.path + ".npy")
+        os.replace(self.path + ".json.tmp", self.path + ".json")
+
+    def _candidate_rows(self, where: Dict[str, Any]) -> np.ndarray:
+        """Rows matching where; video_id equality / $in filters use the per-video index."""
+        cond = where.get("video_id") if len(where) == 1 else None
+        if isinstance(cond, dict):
+            if set(cond) == {"$in"}:
+                cond = cond["$in"]
+            elif set(cond) == {"$eq"}:
+                cond = [cond["$eq"]]
+            else:
+                cond = None
+        elif cond is not None:
+            cond = [cond]
+
+        if cond is None:
+            rows = [n for n, m in enumerate(self._metadatas) if _matches(m, where)]
+        else:
+            if self._video_rows is None:
+                self._video_rows = {}
+                for n, m in enumerate(self._metadatas):
+                    self._video_rows.setdefault(m.get("video_id"), []).append(n)
+            rows = sorted(r for v in set(cond) for r in self._video_rows.get(v, ()))
+        return np.array(rows, dtype=np.int64)
+
+    def upsert(self, ids, documents, embeddings, metadatas):
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        with self._lock:
+            self._video_rows = None
+            if not self._ids:
+                self._matrix = np.zeros((0, vectors.shape[1]), dtype=np.float32)
+
+            new_rows = []
+            for i, doc, vec, meta in zip(ids, documents, vectors, metadatas):
+                row = self._index.get(i)
+                if row is None:
+                    self._index[i] = len(self._ids) + len(new_rows)
+                    new_rows.append(vec)
+                    self._ids.append(i)
+                    self._documents.append(doc)
+                    self._metadatas.append(meta)
+                else:
+                    self._matrix[row] = vec
+                    self._sq_norms[row] = vec @ vec
+                    self._documents[row] = doc
+                    self._metadatas[row] = meta
+
+            if new_rows:
+                added = np.vstack(new_rows)
+                self._matrix = np.ascontiguousarray(np.vstack([self._matrix, added]))
+                self._sq_norms = np.concatenate([self._sq_norms, np.einsum("ij,ij->i", added, added)])
+            self._dirty = True
+
+    def query(self, query_embeddings, n_results=4, where=None, include=None):
+        result = {"ids": [], "documents": [], "metadatas": [], "distances": [], "embeddings": []}
+        with self._lock:
+            candidates = self._candidate_rows(where) if where else None
+            matrix = self._matrix if candidates is None else self._matrix[candidates]
+            sq_norms = self._sq_norms if candidates is None else self._sq_norms[candidates]
+
+            for q in np.asarray(query_embeddings, dtype=np.float32):
+                k = min(n_results, len(sq_norms))
+                if k == 0:
+                    rows, dists = [], []
+                else:
+                    # ||x - q||^2 = ||x||^2 - 2 x.q + ||q||^2
+                    d = sq_norms - 2 * (matrix @ q) + q @ q
+                    top = np.argpartition(d, k - 1)[:k]
+                    top = top[np.argsort(d[top])]
+                    dists = d[top].tolist()
+                    rows = top if candidates is None else candidates[top]
+
+                result["ids"].append([self._ids[r] for r in rows])
+                result["documents"].append([self._documents[r] for r in rows])
+                result["metadatas"].append([self._metadatas[r] for r in rows])
+                result["distances"].append(dists)
+                result["embeddings"].append(self._matrix[rows] if len(rows) else np.zeros((0, 0), np.float32))
+        if "embeddings" not in (include or ()):
+            del result["embeddings"]
+        return result
+
+    def get(self, where=None, include=None):
+        with self._lock:
+            rows = self._candidate_rows(where) if where else range(len(self._ids))
+            return {
+                "ids": [self._ids[r] for r in rows],
+                "documents": [self._documents[r] for r in rows],
+                "metadatas": [self._metadatas[r] for r in rows],
+            }
+
+    def delete(self, ids):
+        with self._lock:
+            drop = {self._index[i] for i in ids if i in self._index}
+            if not drop:
+                return
+            self._video_rows = None
+            keep = [n for n in range(len(self._ids)) if n not in drop]
+            self._matrix = np.ascontiguousarray(self._matrix[keep])
+            self._sq_norms = self._sq_norms[keep]
+            self._ids = [self._ids[n] for n in keep]
+            self._documents = [self._documents[n] for n in keep]
+            self._metadatas = [self._metadatas[n] for n in keep]
+            self._index = {i: n for n, i in enumerate(self._ids)}
+            self._dirty = True
+
+    def count(self):
+        return len(self._ids)
+
+
+# Process-wide registry: one PersistentClient per persist_dir and cached
+# vector store handles, so warm requests never construct a client
+_registry_lock = threading.RLock()
+_clients: Dict[str, Any] = {}
+_collections: Dict[Tuple[str, str, str], VectorStore] = {}
+
+
+def _registry_key(persist_dir: str) -> str:
+    return os.path.abspath(persist_dir)
+
+
+def _numpy_path(collection_name: str, persist_dir: str) -> Optional[str]:
+    if not NUMPY_STORE_PERSIST:
+        return None
+    return os.path.join(_registry_key(persist_dir), "numpy", collection_name)
+
+
+def get_chroma_client(persist_dir: str = "chromadb_store"):
+    """Return the shared PersistentClient for persist_dir, opening it on first use."""
+    key = _registry_key(persist_dir)
+    client = _clients.get(key)
+    if client is not None:
+        return client
+
+    with _registry_lock:
+        client = _clients.get(key)
+        if client is None:
+            Path(persist_dir).mkdir(parents=True, exist_ok=True)
+            # ✅ NEW: use PersistentClient instead of Client + Settings
+            client = chromadb.PersistentClient(path=key)
+            _clients[key] = client
+        return client
+
+
+def get_collection(
+    collection_name: str,
     persist_dir: str = "chromadb_store",
-    reset_collection: bool = True,
-):
+    create: bool = False,
+    backend: str = VECTOR_BACKEND,
+) -> VectorStore:
     """
-    Store chunk embeddings into a ChromaDB collection.
+    Return a cached VectorStore for the collection on the configured backend.
 
-    all_data: list of dicts from create_chunks_from_paragraphs()
-              each item must have: text, embedding, chunk_id, video_id, filename, model
+    With create=False a missing collection raises (like client.get_collection).
     """
-    # Ensure persist directory exists
-    persist_path = Path(persist_dir)
-    persist_path.mkdir(parents=True, exist_ok=True)
+    if backend not in VECTOR_BACKENDS:
+        raise ValueError(f"Unknown vector backend: {backend}; expected one of {VECTOR_BACKENDS}")
 
-    # ✅ NEW: use PersistentClient instead of Client + Settings
-    client = chromadb.PersistentClient(path=str(persist_path))
+    key = (backend, _registry_key(persist_dir), collection_name)
+    collection = _collections.get(key)
+    if collection is not None:
+        return collection
 
-    # Optionally reset collection
-    if reset_collection:
+    with _registry_lock:
+        collection = _collections.get(key)
+        if collection is None:
+            if backend == "numpy":
+                path = _numpy_path(collection_name, persist_dir)
+                if not create and not (path and os.path.exists(path + ".npy")):
+                    raise ValueError(f"Collection {collection_name} does not exist.")
+                collection = NumpyVectorStore(path)
+            else:
+                client = get_chroma_client(persist_dir)
+                if create:
+                    # No embedding_function because we supply embeddings manually
+                    collection = ChromaVectorStore(client.get_or_create_collection(
+                        name=collection_name,
+                        embedding_function=None,
+                    ))
+                else:
+                    collection = ChromaVectorStore(client.get_collection(collection_name))
+            _collections[key] = collection
+        return collection
+
+
+def delete_collection(
+    collection_name: str,
+    persist_dir: str = "chromadb_store",
+    backend: str = VECTOR_BACKEND,
+) -> None:
+    """Delete a collection (if it exists) and drop its cached handle."""
+    with _registry_lock:
+        _collections.pop((backend, _registry_key(persist_dir), collection_name), None)
+        if backend == "numpy":
+            path = _numpy_path(collection_name, persist_dir)
+            for suffix in (".npy", ".json"):
+                if path and os.path.exists(path + suffix):
+                    os.remove(path + suffix)
+            return
         try:
-            client.delete_collection(collection_name)
+            get_chroma_client(persist_dir).delete_collection(collection_name)
         except Exception:
             # Ignore if collection does not exist
             pass
 
-    # No embedding_function because we supply embeddings manually
-    collection = client.get_or_create_collection(
-        name=collection_name,
-        embedding_function=None,
-    )
 
+SESSION_SEPARATOR = "__"
+
+
+def session_collection_name(collection_name: str, session_id: str = DEFAULT_SESSION_ID) -> str:
+    """
+    Name of the session's own copy of a collection; the default session keeps the plain name.
+
+    collection_name may not contain SESSION_SEPARATOR, otherwise a default-session
+    collection could be attributed to (and deleted with) another session.
+    """
+    if not re.match(COLLECTION_NAME_PATTERN, collection_name or ""):
+        raise ValueError(f"Invalid collection name: {collection_name!r}")
+    if not re.match(SESSION_ID_PATTERN, session_id or ""):
+        raise ValueError(f"Invalid session id: {session_id!r}")
+    if session_id == DEFAULT_SESSION_ID:
+        return collection_name
+    return f"{collection_name}{SESSION_SEPARATOR}{session_id}"
+
+
+def collection_session(collection_name: str) -> str:
+    """Session that owns a collection (inverse of session_collection_name)."""
+    _, sep, session_id = collection_name.rpartition(SESSION_SEPARATOR)
+    return session_id if sep else DEFAULT_SESSION_ID
+
+
+def list_collection_names(persist_dir: str = "chromadb_store", backend: str = VECTOR_BACKEND) -> List[str]:
+    """Names of the collections stored under persist_dir on a backend."""
+    if backend == "numpy":
+        key = _registry_key(persist_dir)
+        numpy_dir = Path(key) / "numpy"
+        names = {p.stem for p in numpy_dir.glob("*.npy")} if numpy_dir.exists() else set()
+        # Unpersisted NumPy collections only live in the registry
+        names.update(k[2] for k in list(_collections) if k[0] == "numpy" and k[1] == key)
+        return sorted(names)
+    return [col.name for col in get_chroma_client(persist_dir).list_collections()]
+
+
+def clear_session(session_id: str, persist_dir: str = "chromadb_store") -> List[str]:
+    """Delete every collection of one session on both backends; returns the deleted names."""
+    deleted = []
+    for backend in VECTOR_BACKENDS:
+        for name in list_collection_names(persist_dir, backend):
+            if collection_session(name) == session_id:
+                delete_collection(name, persist_dir, backend=backend)
+                deleted.append(name)
+    return deleted
+
+
+def _open_collection(
+    collection_name: str,
+    persist_dir: str,
+    reset_collection: bool,
+):
+    """Open (and optionally reset) a collection that takes manually supplied embeddings."""
+    # Optionally reset collection
+    if reset_collection:
+        delete_collection(collection_name, persist_dir)
+
+    return get_collection(collection_name, persist_dir, create=True)
+
+
+def _add_in_batches(collection, chunks: Iterable[Dict[str, Any]], flush_size: int) -> int:
+    """
+    Upsert chunks into the collection, flushing every flush_size chunks.
+
+    Ids are deterministic ({video_id}_chunk_{n}), so re-ingesting a video
+    overwrites its chunks instead of duplicating them.
+    Returns the number of chunks stored.
+    """
     ids = []
     documents = []
     embeddings = []
     metadatas = []
+    stored = 0
 
-    for d in all_data:
+    def flush():
+        collection.upsert(ids, documents, embeddings, metadatas)
+        ids.clear()
+        documents.clear()
+        embeddings.clear()
+        metadatas.clear()
+
+    for d in chunks:
         vid = d.get("video_id", "video")
         cid = d.get("chunk_id", 0)
 
         ids.append(f"{vid}_chunk_{cid}")
         documents.append(d["text"])
         embeddings.append(d["embedding"])
-        metadatas.append({
+        metadata = {
             "chunk_id": cid,
             "video_id": vid,
             "filename": d.get("filename", ""),
             "model": d.get("model", ""),
-        })
+        }
+        # Chroma metadata values cannot be None; omit unknown start times
+        if d.get("start_time") is not None:
+            metadata["start_time"] = d["start_time"]
+        if d.get("fingerprint"):
+            metadata["fingerprint"] = d["fingerprint"]
+        metadatas.append(metadata)
+        stored += 1
+
+        if len(ids) >= flush_size:
+            flush()
 
     if ids:
-        collection.add(
-            ids=ids,
-            documents=documents,
-            embeddings=embeddings,
-            metadatas=metadatas,
-        )
+        flush()
+
+    return stored
 
-    # ✅ In new API, PersistentClient persists automatically – no client.persist()
+
+def store_embeddings_in_chroma(
+    all_data: Iterable[Dict[str, Any]],
+    collection_name: str = "video_chunks",
+    persist_dir: str = "chromadb_store",
+    reset_collection: bool = False,
+    flush_size: int = CHROMA_ADD_BATCH_SIZE,
+):
+    """
+    Store chunk embeddings into a ChromaDB collection.
+
+    all_data: list of dicts from create_chunks_from_paragraphs()
+              (or the iter_embedded_chunks() generator)
+              each item must have: text, embedding, chunk_id, video_id, filename, model
+    """
+    collection = _open_collection(collection_name, persist_dir, reset_collection)
+    try:
+        _add_in_batches(collection, all_data, flush_size)
+    finally:
+        # ✅ PersistentClient persists automatically; the NumPy store writes once here
+        collection.persist()
     return collection
 
 
+def stream_embeddings_to_chroma(
+    chunks: Iterable[Dict[str, Any]],
+    collection_name: str = "video_chunks",
+    persist_dir: str = "chromadb_store",
+    reset_collection: bool = False,
+    flush_size: int = CHROMA_ADD_BATCH_SIZE,
+) -> int:
+    """
+    Consume a chunk generator and persist it in fixed-size batches as it arrives.
+
+    Returns the number of chunks stored. Batches already stored are
+    persisted even if the generator fails part-way.
+    """
+    collection = _open_collection(collection_name, persist_dir, reset_collection)
+    try:
+        return _add_in_batches(collection, chunks, flush_size)
+    finally:
+        collection.persist()
+
+
+def count_video_chunks(
+    video_id: str,
+    fingerprint: str,
+    collection_name: str = "video_chunks",
+    persist_dir: str = "chromadb_store",
+) -> int:
+    """Number of chunks stored for video_id under fingerprint (read-only)."""
+    collection = _open_collection(collection_name, persist_dir, reset_collection=False)
+    got = collection.get(where={"video_id": video_id}, include=["metadatas"])
+
+    metadatas = got.get("metadatas") or []
+    return sum(1 for m in metadatas if (m or {}).get("fingerprint") == fingerprint)
 
 
-def clear_chromadb(persist_dir: str = "chromadb_store"):
-    
-    persist_path = Path(persist_dir)
-    persist_path.mkdir(parents=True, exist_ok=True)
+def prune_video_chunks(
+    video_id: str,
+    fingerprint: str,
+    chunk_count: int,
+    collection_name: str = "video_chunks",
+    persist_dir: str = "chromadb_store",
+) -> int:
+    """
+    Delete the chunks of video_id left over from an earlier ingest.
 
-    client = chromadb.PersistentClient(path=str(persist_path))
+    Call after the new chunks are stored: chunk ids count from 1, so upsert
+    already overwrote {video_id}_chunk_1 .. chunk_count and only chunks
+    beyond chunk_count (or still carrying another fingerprint) are stale. The old chunks stay
+    searchable until the new ones are in place.
+    Returns the number of chunks deleted.
+    """
+    collection = _open_collection(collection_name, persist_dir, reset_collection=False)
+    got = collection.get(where={"video_id": video_id}, include=["metadatas"])
 
-    # Get all existing collections
-    collections = client.list_collections()
+    ids = got.get("ids") or []
+    metadatas = got.get("metadatas") or [None] * len(ids)
+    stale = [
+        i for i, m in zip(ids, metadatas)
+        if (m or {}).get("fingerprint") != fingerprint or (m or {}).get("chunk_id", 0) > chunk_count
+    ]
+    if stale:
+        print(f"Deleting {len(stale)} stale chunks of video_id={video_id}")
+        collection.delete(ids=stale)
+        collection.persist()
+
+    return len(stale)
+
+
+def current_video_chunks(
+    video_id: str,
+    fingerprint: str,
+    expected_chunks: int,
+    collection_name: str = "video_chunks",
+    persist_dir: str = "chromadb_store",
+    reset_collection: bool = False,
+) -> int:
+    """
+    Chunks of video_id already stored under fingerprint, if all expected_chunks
+    are there (the video can be skipped); 0 if it has to be (re-)ingested.
+    """
+    if reset_collection:
+        return 0
+    existing = count_video_chunks(video_id, fingerprint, collection_name, persist_dir)
+    return existing if existing and existing == expected_chunks else 0
+
+
+def replace_video_chunks(
+    chunks: Iterable[Dict[str, Any]],
+    fingerprints: Dict[str, str],
+    collection_name: str = "video_chunks",
+    persist_dir: str = "chromadb_store",
+    reset_collection: bool = False,
+    flush_size: int = CHROMA_ADD_BATCH_SIZE,
+) -> Dict[str, int]:
+    """
+    Stream chunks of one or more videos into the collection, then drop what is
+    left of each video's earlier ingest.
+
+    fingerprints maps video_id to the fingerprint of its new chunks; it may be
+    filled while chunks is consumed. The prune runs only after the whole stream
+    is stored, so a failed (re-)ingest keeps the old chunks searchable.
+    Returns the number of chunks stored per video_id.
+    """
+    counts: Dict[str, int] = {}
 
-    for col in collections:
-        client.delete_collection(col.name)
+    def counted():
+        for chunk in chunks:
+            vid = chunk.get("video_id", "video")
+            counts[vid] = counts.get(vid, 0) + 1
+            yield chunk
 
-    return f"Deleted {len(collections)} collections from ChromaDB."
+    stream_embeddings_to_chroma(counted(), collection_name, persist_dir, reset_collection, flush_size)
+    if not reset_collection:
+        for vid, stored in counts.items():
+            prune_video_chunks(vid, fingerprints[vid], stored, collection_name, persist_dir)
+    return counts
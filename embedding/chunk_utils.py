@@ -1,11 +1,16 @@
 # chunk_utils.py
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Callable, Iterable, Iterator, Optional, Tuple
+import asyncio
+import hashlib
 import json
 from google import genai
 from google.genai import types
 import os
 from dotenv import load_dotenv
+from youtube.config import EMBED_BATCH_SIZE, EMBED_MAX_WORKERS, EMBED_TIMEOUT_S
+from embedding.embed_executor import call_with_retry, acall_with_retry, map_ordered
+from embedding import embed_cache
 
 # Load environment variables from .env file
 load_dotenv()
@@ -17,35 +22,105 @@ EMBED_DIM = 768
 # Initialize Gemini client
 client = genai.Client(api_key=GOOGLE_API_KEY)
 
-def create_chunks_from_paragraphs(
-    paragraphs: List[str],
-    chunk_size_words: int = 300,
-    overlap_words: int = 50,
-    filename: str = "",
-    video_id: str = ""
-) -> List[Dict[str, Any]]:
+def _embed_config() -> types.EmbedContentConfig:
+    return types.EmbedContentConfig(
+        output_dimensionality=EMBED_DIM,
+        http_options=types.HttpOptions(timeout=int(EMBED_TIMEOUT_S * 1000)),
+    )
+
+
+def _embedding_values(batch: List[str], result) -> List[List[float]]:
+    if len(result.embeddings) != len(batch):
+        raise RuntimeError(
+            f"Expected {len(batch)} embeddings, got {len(result.embeddings)}"
+        )
+    return [e.values for e in result.embeddings]
+
+
+def _embed_batch(batch: List[str]) -> List[List[float]]:
+    """Embed one batch of texts in a single request, retrying transient errors."""
+    result = call_with_retry(
+        client.models.embed_content,
+        model=EMBED_MODEL,
+        contents=batch,
+        config=_embed_config()
+    )
+    return _embedding_values(batch, result)
+
+
+async def _aembed_batch_cached(batch: List[str]) -> List[List[float]]:
+    """Async _embed_batch_cached: cache I/O runs in a thread, the request on the async client."""
+    cached = await asyncio.to_thread(embed_cache.get_many, batch, EMBED_MODEL, EMBED_DIM)
+    missing = list(dict.fromkeys(t for t in batch if t not in cached))
+
+    if missing:
+        result = await acall_with_retry(
+            client.aio.models.embed_content,
+            model=EMBED_MODEL,
+            contents=missing,
+            config=_embed_config()
+        )
+        fresh = dict(zip(missing, _embedding_values(missing, result)))
+        await asyncio.to_thread(embed_cache.put_many, fresh, EMBED_MODEL, EMBED_DIM)
+        cached.update(fresh)
+
+    return [cached[t] for t in batch]
+
+
+def _embed_batch_cached(batch: List[str]) -> List[List[float]]:
+    """Embed one batch, serving cached texts from disk and requesting only the misses."""
+    cached = embed_cache.get_many(batch, EMBED_MODEL, EMBED_DIM)
+    missing = list(dict.fromkeys(t for t in batch if t not in cached))
+
+    if missing:
+        fresh = dict(zip(missing, _embed_batch(missing)))
+        embed_cache.put_many(fresh, EMBED_MODEL, EMBED_DIM)
+        cached.update(fresh)
+
+    return [cached[t] for t in batch]
+
+
+def _batched(items: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    """Yield lists of up to size items from any iterable."""
+    if size < 1:
+        raise ValueError("batch_size must be at least 1")
+
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+async def aembed_texts(texts: List[str], batch_size: int = EMBED_BATCH_SIZE) -> List[List[float]]:
     """
-    Creates overlapping text chunks from paragraphs and generates embeddings.
-    
-    Args:
-        paragraphs: List of paragraph strings
-        chunk_size_words: Number of words per chunk
-        overlap_words: Number of overlapping words between chunks
-        filename: Optional filename for metadata
-        video_id: Optional video ID for metadata
-    
-    Returns:
-        List of dictionaries containing chunk data with embeddings
+    Embed texts for the request path (e.g. query embeddings), in input order.
+
+    Batches are requested concurrently on the async Gemini client, so no
+    worker thread is held while waiting on the network.
     """
-    # Normalize and join paragraphs
-    normalized_text = "\n\n".join(
-        p.strip() for p in paragraphs if p and p.strip()
-    )
+    results = await asyncio.gather(*(
+        _aembed_batch_cached(batch) for batch in _batched(texts, batch_size)
+    ))
+    return [embedding for batch_embeddings in results for embedding in batch_embeddings]
+
 
-    words = normalized_text.split()
-    if not words:
-        return []
+def iter_chunk_windows(
+    paragraphs: Iterable[str],
+    chunk_size_words: int = 300,
+    overlap_words: int = 50,
+    paragraph_starts: Optional[Iterable[Optional[float]]] = None
+) -> Iterator[Tuple[str, Optional[float]]]:
+    """
+    Lazily yields (chunk_text, start_time) overlapping word-window chunks.
 
+    Produces exactly the chunks of a sliding window over all words, but only
+    ever holds one window of words in memory. start_time is the start of the
+    paragraph holding the chunk's first word, or None without paragraph_starts.
+    """
     # Validate parameters
     if overlap_words >= chunk_size_words:
         raise ValueError("overlap_words must be less than chunk_size_words")
@@ -53,43 +128,166 @@ def create_chunks_from_paragraphs(
         overlap_words = 0
 
     step = chunk_size_words - overlap_words
-    all_chunks = []
-    start_idx = 0
-    chunk_id = 1
+    window = []
+    window_starts = []
+    has_new_words = False
+    starts = iter(paragraph_starts) if paragraph_starts is not None else None
 
-    # Create overlapping chunks
-    while start_idx < len(words):
-        end_idx = min(start_idx + chunk_size_words, len(words))
-        chunk_text = " ".join(words[start_idx:end_idx])
+    for p in paragraphs:
+        start = next(starts, None) if starts is not None else None
+        if not p:
+            continue
+        for word in p.split():
+            window.append(word)
+            window_starts.append(start)
+            has_new_words = True
+            if len(window) == chunk_size_words:
+                yield " ".join(window), window_starts[0]
+                window = window[step:]
+                window_starts = window_starts[step:]
+                has_new_words = False
 
-        # Generate embedding for this chunk
-        result = client.models.embed_content(
-            model=EMBED_MODEL,
-            contents=chunk_text,
-            config=types.EmbedContentConfig(output_dimensionality=EMBED_DIM)
-        )
-        
-        embedding = result.embeddings[0].values
-        
-        # Store chunk with all necessary information
-        chunk_data = {
+    # Trailing words not yet covered by a full window
+    if has_new_words:
+        yield " ".join(window), window_starts[0]
+
+
+def chunk_fingerprint(paragraphs: Iterable[str], chunk_size_words: int, overlap_words: int) -> str:
+    """Hash of the transcript paragraphs, chunk parameters and embedding model."""
+    h = hashlib.sha256(f"{EMBED_MODEL}|{EMBED_DIM}|{chunk_size_words}|{overlap_words}".encode("utf-8"))
+    for p in paragraphs:
+        h.update(b"\n")
+        h.update(p.encode("utf-8"))
+    return h.hexdigest()
+
+
+def count_chunks(paragraphs: Iterable[str], chunk_size_words: int = 300, overlap_words: int = 50) -> int:
+    """Number of chunks the paragraphs produce, without embedding anything."""
+    return sum(1 for _ in iter_chunk_windows(paragraphs, chunk_size_words, overlap_words))
+
+
+def iter_chunk_records(
+    paragraphs: Iterable[str],
+    chunk_size_words: int = 300,
+    overlap_words: int = 50,
+    filename: str = "",
+    video_id: str = "",
+    paragraph_starts: Optional[Iterable[Optional[float]]] = None,
+    fingerprint: str = ""
+) -> Iterator[Dict[str, Any]]:
+    """Lazily yields the chunk dicts of one video, without embeddings."""
+    windows = iter_chunk_windows(paragraphs, chunk_size_words, overlap_words, paragraph_starts)
+    for chunk_id, (chunk_text, start_time) in enumerate(windows, start=1):
+        yield {
             "chunk_id": chunk_id,
             "text": chunk_text,  # CRITICAL: Store the actual text
-            "embedding": embedding,
-            "embedding_dim": len(embedding),
-            "model": EMBED_MODEL,
             "filename": filename,
-            "video_id": video_id
+            "video_id": video_id,
+            "start_time": start_time,
+            "fingerprint": fingerprint
         }
-        
-        all_chunks.append(chunk_data)
-        chunk_id += 1
-        start_idx += step
 
-        if end_idx >= len(words):
-            break
 
-    return all_chunks
+def embed_chunk_records(
+    records: Iterable[Dict[str, Any]],
+    batch_size: int = EMBED_BATCH_SIZE,
+    max_workers: int = EMBED_MAX_WORKERS
+) -> Iterator[Dict[str, Any]]:
+    """
+    Embed a stream of chunk dicts batch by batch, in order.
+
+    Records may come from several videos; they share embedding batches.
+    Each yielded dict gains embedding, embedding_dim and model.
+    """
+    def embed(batch: List[Dict[str, Any]]):
+        return batch, _embed_batch_cached([record["text"] for record in batch])
+
+    for batch, embeddings in map_ordered(embed, _batched(records, batch_size), max_in_flight=max_workers):
+        for record, embedding in zip(batch, embeddings):
+            yield {
+                **record,
+                "embedding": embedding,
+                "embedding_dim": len(embedding),
+                "model": EMBED_MODEL,
+            }
+
+
+def iter_embedded_chunks(
+    paragraphs: Iterable[str],
+    chunk_size_words: int = 300,
+    overlap_words: int = 50,
+    filename: str = "",
+    video_id: str = "",
+    batch_size: int = EMBED_BATCH_SIZE,
+    max_workers: int = EMBED_MAX_WORKERS,
+    paragraph_starts: Optional[Iterable[Optional[float]]] = None,
+    fingerprint: str = ""
+) -> Iterator[Dict[str, Any]]:
+    """
+    Streaming version of create_chunks_from_paragraphs.
+
+    Chunks are embedded batch by batch on the embedding pool while earlier
+    results are handed to the consumer, so a caller that persists each chunk
+    as it arrives overlaps embedding with storage and keeps memory flat.
+    With paragraph_starts (seconds, parallel to paragraphs) every chunk also
+    carries the start_time of its first word's paragraph. fingerprint (see
+    chunk_fingerprint) is stored with every chunk for incremental ingest.
+    """
+    records = iter_chunk_records(
+        paragraphs, chunk_size_words, overlap_words, filename, video_id, paragraph_starts, fingerprint
+    )
+    return embed_chunk_records(records, batch_size, max_workers)
+
+
+def iter_with_progress(
+    chunks: Iterable[Dict[str, Any]],
+    on_progress: Callable[[int], None],
+    every: int = 25
+) -> Iterator[Dict[str, Any]]:
+    """Pass chunks through, calling on_progress(count) every `every` chunks and at the end."""
+    count = 0
+    for chunk in chunks:
+        yield chunk
+        count += 1
+        if count % every == 0:
+            on_progress(count)
+    on_progress(count)
+
+
+def ignore_progress(stage: str, chunks_embedded: int = 0, snapshot: Optional[dict] = None) -> None:
+    """Default ingest progress callback; discards updates."""
+
+
+def create_chunks_from_paragraphs(
+    paragraphs: List[str],
+    chunk_size_words: int = 300,
+    overlap_words: int = 50,
+    filename: str = "",
+    video_id: str = "",
+    batch_size: int = EMBED_BATCH_SIZE
+) -> List[Dict[str, Any]]:
+    """
+    Creates overlapping text chunks from paragraphs and generates embeddings.
+    
+    Args:
+        paragraphs: List of paragraph strings
+        chunk_size_words: Number of words per chunk
+        overlap_words: Number of overlapping words between chunks
+        filename: Optional filename for metadata
+        video_id: Optional video ID for metadata
+        batch_size: Number of chunks embedded per Gemini request
+    
+    Returns:
+        List of dictionaries containing chunk data with embeddings
+    """
+    return list(iter_embedded_chunks(
+        paragraphs,
+        chunk_size_words=chunk_size_words,
+        overlap_words=overlap_words,
+        filename=filename,
+        video_id=video_id,
+        batch_size=batch_size,
+    ))
 
 
 def save_embeddings_json(all_data: List[Dict[str, Any]], out_file: str = "embeddings.json") -> str:
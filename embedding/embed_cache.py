@@ -0,0 +1,114 @@
+# embed_cache.py
+"""
+Content-addressed, disk-backed embedding cache.
+
+Vectors are keyed by sha256(model, dim, text) and stored as float32 blobs in
+a local SQLite file. Least recently used entries are evicted once the cache
+grows past EMBED_CACHE_MAX_ENTRIES.
+"""
+import hashlib
+import sqlite3
+import threading
+import time
+from array import array
+from typing import Dict, List
+
+from youtube.config import EMBED_CACHE_PATH, EMBED_CACHE_MAX_ENTRIES
+
+_lock = threading.Lock()
+_conn = None
+_stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+
+def _get_conn() -> sqlite3.Connection:
+    """Open the cache database once per process and create the table."""
+    global _conn
+    if _conn is None:
+        _conn = sqlite3.connect(EMBED_CACHE_PATH, check_same_thread=False)
+        _conn.execute("PRAGMA journal_mode=WAL")
+        _conn.execute('''
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL
+            )
+        ''')
+        _conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings(last_used)")
+        _conn.commit()
+    return _conn
+
+
+def cache_key(text: str, model: str, dim: int) -> str:
+    """Return the content address for an embedding of text."""
+    h = hashlib.sha256()
+    h.update(f"{model}\x00{dim}\x00".encode("utf-8"))
+    h.update(text.encode("utf-8"))
+    return h.hexdigest()
+
+
+def get_many(texts: List[str], model: str, dim: int) -> Dict[str, List[float]]:
+    """Look up cached embeddings; returns {text: vector} for the hits only."""
+    keys = {cache_key(t, model, dim): t for t in set(texts)}
+    found = {}
+
+    with _lock:
+        conn = _get_conn()
+        key_list = list(keys)
+        # Stay well below SQLite's bound-parameter limit
+        for start in range(0, len(key_list), 500):
+            part = key_list[start:start + 500]
+            rows = conn.execute(
+                f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(part))})",
+                part,
+            ).fetchall()
+            for key, blob in rows:
+                found[keys[key]] = array("f", blob).tolist()
+
+        if found:
+            now = time.time()
+            conn.executemany(
+                "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                [(now, cache_key(t, model, dim)) for t in found],
+            )
+            conn.commit()
+
+        _stats["hits"] += len(found)
+        _stats["misses"] += len(keys) - len(found)
+
+    return found
+
+
+def put_many(items: Dict[str, List[float]], model: str, dim: int) -> None:
+    """Store {text: vector} pairs and evict least recently used entries."""
+    if not items:
+        return
+
+    now = time.time()
+    rows = [
+        (cache_key(t, model, dim), array("f", v).tobytes(), now)
+        for t, v in items.items()
+    ]
+
+    with _lock:
+        conn = _get_conn()
+        conn.executemany(
+            "INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+            rows,
+        )
+        count = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        excess = count - EMBED_CACHE_MAX_ENTRIES
+        if excess > 0:
+            conn.execute('''
+                DELETE FROM embeddings WHERE key IN (
+                    SELECT key FROM embeddings ORDER BY last_used LIMIT ?
+                )
+            ''', (excess,))
+            _stats["evictions"] += excess
+        conn.commit()
+
+
+def cache_stats() -> Dict[str, int]:
+    """Return hit/miss/eviction counters for this process and the entry count."""
+    with _lock:
+        entries = _get_conn().execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        return {**_stats, "entries": entries}
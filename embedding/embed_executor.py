@@ -0,0 +1,122 @@
+# embed_executor.py
+"""
+Bounded worker pool for embedding requests, with retry and jittered backoff.
+"""
+import asyncio
+import random
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Iterable, Iterator, TypeVar
+
+from youtube.config import (
+    EMBED_MAX_WORKERS,
+    EMBED_MAX_RETRIES,
+    EMBED_BACKOFF_BASE_S,
+    EMBED_BACKOFF_MAX_S,
+)
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+# HTTP status codes worth retrying (timeouts, rate limits, server errors)
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+# Shared pool so concurrent ingests together never exceed EMBED_MAX_WORKERS calls
+_executor = ThreadPoolExecutor(max_workers=EMBED_MAX_WORKERS, thread_name_prefix="embed")
+
+
+def is_retryable_error(exc: Exception) -> bool:
+    """Return True for transient errors (429, 5xx, timeouts, dropped connections)."""
+    code = getattr(exc, "code", None) or getattr(exc, "status_code", None)
+    if isinstance(code, int):
+        return code in RETRYABLE_STATUS_CODES
+
+    if isinstance(exc, (TimeoutError, ConnectionError)):
+        return True
+
+    # httpx transport errors (used by google-genai) are not builtin subclasses
+    name = type(exc).__name__
+    return name.endswith("Timeout") or name in ("ConnectError", "ReadError", "RemoteProtocolError")
+
+
+def backoff_delay(attempt: int, base_delay: float, max_delay: float) -> float:
+    """Full-jitter exponential backoff for the given (0-based) retry attempt."""
+    return random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+
+
+def call_with_retry(
+    fn: Callable[..., R],
+    *args: Any,
+    max_retries: int = EMBED_MAX_RETRIES,
+    base_delay: float = EMBED_BACKOFF_BASE_S,
+    max_delay: float = EMBED_BACKOFF_MAX_S,
+    **kwargs: Any
+) -> R:
+    """
+    Call fn, retrying retryable errors with full-jitter exponential backoff.
+
+    Non-retryable errors, and the last retryable one, are re-raised unchanged.
+    """
+    attempt = 0
+    while True:
+        try:
+            return fn(*args, **kwargs)
+        except Exception as e:
+            if attempt >= max_retries or not is_retryable_error(e):
+                raise
+            delay = backoff_delay(attempt, base_delay, max_delay)
+            attempt += 1
+            print(f"Retryable embedding error ({e}); retry {attempt}/{max_retries} in {delay:.2f}s")
+            time.sleep(delay)
+
+
+async def acall_with_retry(
+    fn: Callable[..., Awaitable[R]],
+    *args: Any,
+    max_retries: int = EMBED_MAX_RETRIES,
+    base_delay: float = EMBED_BACKOFF_BASE_S,
+    max_delay: float = EMBED_BACKOFF_MAX_S,
+    **kwargs: Any
+) -> R:
+    """Async call_with_retry: awaits fn and backs off without blocking the event loop."""
+    attempt = 0
+    while True:
+        try:
+            return await fn(*args, **kwargs)
+        except Exception as e:
+            if attempt >= max_retries or not is_retryable_error(e):
+                raise
+            delay = backoff_delay(attempt, base_delay, max_delay)
+            attempt += 1
+            print(f"Retryable embedding error ({e}); retry {attempt}/{max_retries} in {delay:.2f}s")
+            await asyncio.sleep(delay)
+
+
+def map_ordered(
+    fn: Callable[[T], R],
+    items: Iterable[T],
+    max_in_flight: int = EMBED_MAX_WORKERS
+) -> Iterator[R]:
+    """
+    Run fn over items on the shared pool and yield results in input order.
+
+    At most max_in_flight calls are outstanding for this caller, so items
+    may be a lazy iterator and is only consumed as results are drained.
+    """
+    if max_in_flight < 1:
+        raise ValueError("max_in_flight must be at least 1")
+
+    pending = deque()
+    try:
+        for item in items:
+            pending.append(_executor.submit(fn, item))
+            if len(pending) >= max_in_flight:
+                yield pending.popleft().result()
+
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        # Consumer stopped early or a call failed: drop work not yet started
+        for future in pending:
+            future.cancel()
@@ -0,0 +1,300 @@
+# jobs.py - Background ingest jobs with a persisted job table
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Query
+
+from youtube.config import (
+    JOBS_DB_PATH,
+    JOB_WORKERS,
+    JOB_HEARTBEAT_S,
+    JOB_LEASE_S,
+    DEFAULT_CHUNK_SIZE,
+    DEFAULT_CHUNK_OVERLAP,
+    DEFAULT_COLLECTION_NAME,
+    DEFAULT_PERSIST_DIR,
+    DEFAULT_SESSION_ID,
+    SESSION_ID_PATTERN,
+    COLLECTION_NAME_PATTERN,
+)
+from youtube.new_youtube import ingest_supadata_video
+from youtube.routes import ingest_youtube_video
+from youtube.bulk import ingest_playlist
+
+router = APIRouter()
+
+# Transcript source -> ingest pipeline
+INGEST_SOURCES = {
+    "supadata": ingest_supadata_video,
+    "ytdlp": ingest_youtube_video,
+    "ytdlp_playlist": ingest_playlist,
+}
+
+_executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="ingest-job")
+_db_lock = threading.Lock()
+# Identifies this process as the owner of the jobs it claims (one per uvicorn worker)
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+_heartbeat_lock = threading.Lock()
+_heartbeat: Optional[threading.Thread] = None
+
+
+def _connect() -> sqlite3.Connection:
+    conn = sqlite3.connect(JOBS_DB_PATH)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def create_jobs_table():
+    """Create the job table if it doesn't exist."""
+    with _db_lock:
+        conn = _connect()
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS ingest_jobs (
+                id TEXT PRIMARY KEY,
+                source TEXT NOT NULL,
+                params TEXT NOT NULL,
+                status TEXT NOT NULL,
+                stage TEXT NOT NULL,
+                chunks_embedded INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                result TEXT,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL,
+                owner TEXT,
+                heartbeat REAL
+            )
+        ''')
+        # Job tables created before jobs were claimed with a lease
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(ingest_jobs)")}
+        if "owner" not in columns:
+            conn.execute("ALTER TABLE ingest_jobs ADD COLUMN owner TEXT")
+        if "heartbeat" not in columns:
+            conn.execute("ALTER TABLE ingest_jobs ADD COLUMN heartbeat REAL")
+        conn.commit()
+        conn.close()
+
+
+def _update_job(job_id: str, **fields):
+    columns = ", ".join(f"{k} = ?" for k in fields)
+    with _db_lock:
+        conn = _connect()
+        conn.execute(f"UPDATE ingest_jobs SET {columns} WHERE id = ?", (*fields.values(), job_id))
+        conn.commit()
+        conn.close()
+
+
+def get_job(job_id: str) -> Optional[dict]:
+    """Return a job row as a dict, or None if unknown."""
+    with _db_lock:
+        conn = _connect()
+        row = conn.execute("SELECT * FROM ingest_jobs WHERE id = ?", (job_id,)).fetchone()
+        conn.close()
+    return dict(row) if row else None
+
+
+def _claim_job(job_id: str) -> bool:
+    """
+    Atomically move a queued job to running under this process.
+
+    Every worker process may be handed the same job id (on enqueue and on
+    resume); only the one whose UPDATE matches the queued row runs it.
+    """
+    now = time.time()
+    with _db_lock:
+        conn = _connect()
+        cursor = conn.execute('''
+            UPDATE ingest_jobs
+            SET status = 'running', stage = 'starting', owner = ?, heartbeat = ?,
+                started_at = ?, error = NULL, result = NULL
+            WHERE id = ? AND status = 'queued'
+        ''', (WORKER_ID, now, now, job_id))
+        conn.commit()
+        conn.close()
+    return cursor.rowcount == 1
+
+
+def _requeue_stale_jobs() -> int:
+    """Put running jobs whose owner stopped heartbeating back in the queue."""
+    with _db_lock:
+        conn = _connect()
+        cursor = conn.execute('''
+            UPDATE ingest_jobs SET status = 'queued', stage = 'queued', owner = NULL
+            WHERE status = 'running' AND (heartbeat IS NULL OR heartbeat < ?)
+        ''', (time.time() - JOB_LEASE_S,))
+        conn.commit()
+        conn.close()
+    return cursor.rowcount
+
+
+def _heartbeat_loop():
+    """Keep the lease of this process's running jobs fresh and pick up jobs whose owner died."""
+    while True:
+        time.sleep(JOB_HEARTBEAT_S)
+        try:
+            with _db_lock:
+                conn = _connect()
+                conn.execute(
+                    "UPDATE ingest_jobs SET heartbeat = ? WHERE owner = ? AND status = 'running'",
+                    (time.time(), WORKER_ID),
+                )
+                conn.commit()
+                conn.close()
+            if _requeue_stale_jobs():
+                resume_pending_jobs()
+        except sqlite3.Error as e:
+            print(f"Error refreshing ingest job heartbeats: {e}")
+
+
+def _ensure_heartbeat():
+    global _heartbeat
+    if _heartbeat is None:
+        with _heartbeat_lock:
+            if _heartbeat is None:
+                _heartbeat = threading.Thread(target=_heartbeat_loop, name="ingest-job-heartbeat", daemon=True)
+                _heartbeat.start()
+
+
+def _run_job(job_id: str):
+    """Worker: claim one ingest job, run it and record its progress and outcome."""
+    if not _claim_job(job_id):
+        return
+    job = get_job(job_id)
+
+    def progress(stage: str, chunks_embedded: int = 0, snapshot: Optional[dict] = None):
+        # A snapshot (e.g. per-video status of a playlist) is kept in result until the final result replaces it
+        fields = {"stage": stage, "chunks_embedded": chunks_embedded}
+        if snapshot is not None:
+            fields["result"] = json.dumps(snapshot)
+        _update_job(job_id, **fields)
+
+    ingest = INGEST_SOURCES[job["source"]]
+    try:
+        result = ingest(**json.loads(job["params"]), progress=progress)
+        _update_job(
+            job_id,
+            status="completed",
+            stage="completed",
+            result=json.dumps(result),
+            finished_at=time.time(),
+        )
+    except HTTPException as e:
+        print(f"Ingest job {job_id} failed: {e.detail}")
+        _update_job(job_id, status="failed", error=str(e.detail), finished_at=time.time())
+    except Exception as e:
+        print(f"Ingest job {job_id} crashed:\n{traceback.format_exc()}")
+        _update_job(job_id, status="failed", error=str(e), finished_at=time.time())
+
+
+def enqueue_ingest(source: str, params: dict) -> str:
+    """Persist a new ingest job and hand it to the worker pool. Returns the job id."""
+    if source not in INGEST_SOURCES:
+        raise ValueError(f"Unknown transcript source: {source}")
+
+    job_id = uuid.uuid4().hex
+    with _db_lock:
+        conn = _connect()
+        conn.execute('''
+            INSERT INTO ingest_jobs (id, source, params, status, stage, created_at)
+            VALUES (?, ?, ?, 'queued', 'queued', ?)
+        ''', (job_id, source, json.dumps(params), time.time()))
+        conn.commit()
+        conn.close()
+
+    _ensure_heartbeat()
+    _executor.submit(_run_job, job_id)
+    return job_id
+
+
+def resume_pending_jobs() -> int:
+    """
+    Hand queued jobs to the worker pool, after requeueing running jobs whose
+    lease expired (their process stopped). Jobs a live worker is running keep
+    their owner; every process may submit the same queued job, _claim_job lets
+    exactly one of them run it.
+    """
+    _requeue_stale_jobs()
+    with _db_lock:
+        conn = _connect()
+        rows = conn.execute(
+            "SELECT id FROM ingest_jobs WHERE status = 'queued' ORDER BY created_at"
+        ).fetchall()
+        conn.close()
+
+    _ensure_heartbeat()
+    for row in rows:
+        _executor.submit(_run_job, row["id"])
+
+    if rows:
+        print(f"Resumed {len(rows)} pending ingest jobs")
+    return len(rows)
+
+
+def _job_response(job: dict) -> dict:
+    started = job["started_at"]
+    finished = job["finished_at"]
+    elapsed = None
+    if started:
+        elapsed = round((finished or time.time()) - started, 2)
+
+    return {
+        "job_id": job["id"],
+        "source": job["source"],
+        "status": job["status"],
+        "stage": job["stage"],
+        "chunks_embedded": job["chunks_embedded"],
+        "elapsed_seconds": elapsed,
+        "error": job["error"],
+        "result": json.loads(job["result"]) if job["result"] else None,
+        "params": json.loads(job["params"]),
+    }
+
+
+@router.post("/jobs/ingest", summary="Queue a background ingest and return its job id")
+def create_ingest_job(
+    url: str = Query(..., description="YouTube URL or video id"),
+    source: str = Query("supadata", description="Transcript source: 'supadata', 'ytdlp' or 'ytdlp_playlist'"),
+    langs: Optional[str] = Query("hi,en", description="Comma-separated preferred languages"),
+    chunk_size: Optional[int] = Query(DEFAULT_CHUNK_SIZE, description="Words per chunk"),
+    overlap: Optional[int] = Query(DEFAULT_CHUNK_OVERLAP, description="Overlapping words between chunks"),
+    collection_name: str = Query(DEFAULT_COLLECTION_NAME, pattern=COLLECTION_NAME_PATTERN, description="ChromaDB collection name"),
+    persist_dir: str = Query(DEFAULT_PERSIST_DIR, description="ChromaDB persistence directory"),
+    reset_collection: bool = Query(False, description="Reset the ChromaDB collection before inserting"),
+    session_id: str = Query(DEFAULT_SESSION_ID, pattern=SESSION_ID_PATTERN, description="Chat session id"),
+):
+    if not url.strip():
+        raise HTTPException(status_code=400, detail="URL or video id is required")
+    if source not in INGEST_SOURCES:
+        raise HTTPException(status_code=400, detail=f"source must be one of {list(INGEST_SOURCES)}")
+
+    job_id = enqueue_ingest(source, {
+        "url": url,
+        "langs": langs,
+        "chunk_size": chunk_size,
+        "overlap": overlap,
+        "collection_name": collection_name,
+        "persist_dir": persist_dir,
+        "reset_collection": reset_collection,
+        "session_id": session_id,
+    })
+    return {"job_id": job_id, "status": "queued"}
+
+
+@router.get("/jobs/{job_id}", summary="Ingest job status")
+def job_status(job_id: str):
+    job = get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail=f"Unknown job id: {job_id}")
+    return _job_response(job)
+
+
+# Initialize job table on module import
+create_jobs_table()
@@ -1,17 +1,30 @@
 # main.py - Main FastAPI application entry point
 
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Query
 from fastapi.middleware.cors import CORSMiddleware
-from youtube.config import CORS_ORIGINS
+from youtube.config import CORS_ORIGINS, DEFAULT_PERSIST_DIR, DEFAULT_SESSION_ID, SESSION_ID_PATTERN
 from youtube.routes import transcript_router
 from query.query import router as query_router
 from chat_db.history import router as his_router
 from chat_db.summary import router as sum_router
-from chroma.chroma_store import clear_chromadb
+from chroma.chroma_store import clear_session
 from chat_db.databse import delete_all_records
+from embedding.embed_cache import cache_stats
 from mybot.mybot import router as bot_router
 from youtube.new_youtube import router as new_router
-app = FastAPI(title="YouTube Captions Cleaner API")
+from youtube.bulk import bulk_router
+from jobs.jobs import router as jobs_router, resume_pending_jobs
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Queued work survives restarts: pick up jobs left pending in the job table
+    resume_pending_jobs()
+    yield
+
+
+app = FastAPI(title="YouTube Captions Cleaner API", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -27,13 +40,28 @@ app.include_router(his_router, prefix="")
 app.include_router(sum_router, prefix="")
 app.include_router(bot_router, prefix="")
 app.include_router(new_router, prefix="")
+app.include_router(jobs_router, prefix="")
+app.include_router(bulk_router, prefix="")
+
+
 @app.get("/")
 def root():
     return {"status": "ok", "message": "YouTube Captions API is running"}
 
 
+@app.get("/embedding_cache_stats")
+def embedding_cache_stats():
+    # Hits/misses/evictions since this worker started, plus the entries on disk
+    return cache_stats()
+
+
 
 @app.get("/kill_session")
-def kill():
-    clear_chromadb()
-    delete_all_records()
+def kill(
+    session_id: str = Query(DEFAULT_SESSION_ID, pattern=SESSION_ID_PATTERN, description="Chat session id"),
+    persist_dir: str = Query(DEFAULT_PERSIST_DIR, description="ChromaDB persistence directory"),
+):
+    # Only this session's collections and chat history; other sessions are untouched
+    deleted = clear_session(session_id, persist_dir)
+    delete_all_records(session_id)
+    return {"status": "ok", "session_id": session_id, "deleted_collections": deleted}
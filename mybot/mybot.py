@@ -17,7 +17,7 @@ client = genai.Client(api_key=GOOGLE_API_KEY)
 router = APIRouter()
 
 @router.get("/bot")
-def bot(query):
+async def bot(query):
     prompt = f"""
 You are TubeChat — an AI assistant developed by **Rupesh Bhulode**. 
 TubeChat helps users understand YouTube videos by analyzing their content and answering questions based on the video.
@@ -29,7 +29,7 @@ If user ask something unrealted them tell user who u are and told to upload url.
 Listen u are directly taking to user so chat like TubeChat.
 """
 
-    resp = client.models.generate_content(
+    resp = await client.aio.models.generate_content(
         model="gemini-2.0-flash",
         contents=prompt
     )
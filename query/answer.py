@@ -36,6 +36,7 @@ Answer Type Guidelines:
 - "step-by-step": Break down the information into sequential steps or instructions
 
 Important:
+- Always write the answer in English, even though the context data may be Hindi (Devanagari) or Hinglish
 - Use the context data provided to inform your answer
 - Maintain a helpful, conversational tone as if you're personally explaining this to someone
 - Don't simply copy the data text - rephrase and explain it in your own words
@@ -43,13 +44,11 @@ Important:
 """
 
 
-def bot_answer(question, answer_type, history, data):
-    
-    
-    
+async def bot_answer(question, answer_type, history, data):
+    """Answer the question in English directly from (possibly Hindi/Hinglish) context data."""
 
     # Generate response
-    resp = client.models.generate_content(
+    resp = await client.aio.models.generate_content(
         model="gemini-2.0-flash",
         contents=prompt.format(question=question, type=answer_type, data=data)
     )
@@ -57,11 +56,35 @@ def bot_answer(question, answer_type, history, data):
     return resp.text
 
 
+async def bot_answer_stream(question, answer_type, history, data):
+    """Like bot_answer, but yields the answer text piece by piece as Gemini generates it."""
+    async for chunk in await client.aio.models.generate_content_stream(
+        model="gemini-2.0-flash",
+        contents=prompt.format(question=question, type=answer_type, data=data)
+    ):
+        if chunk.text:
+            yield chunk.text
+
+
 p="this is the answer {answer} this may be in english or hindi , so i want u to covert it into english stricty. The output must be in english language only word by word"
 
 
-def english(answer):
-    resp = client.models.generate_content(
+def is_latin_script(text, max_non_latin_ratio=0.1):
+    """True if (almost) all letters in text are Latin script, i.e. no translation is needed."""
+    letters = [c for c in text if c.isalpha()]
+    if not letters:
+        return True
+    # Basic Latin through Latin Extended-B end at U+024F
+    non_latin = sum(1 for c in letters if ord(c) > 0x24F)
+    return non_latin / len(letters) <= max_non_latin_ratio
+
+
+async def english(answer):
+    """Translate an answer to English; answers already in Latin script are returned as-is."""
+    if is_latin_script(answer):
+        return answer
+
+    resp = await client.aio.models.generate_content(
         model="gemini-2.0-flash",
         contents=p.format(answer=answer)
     )
@@ -0,0 +1,123 @@
+# planner.py - one structured Gemini call that plans a query before retrieval
+
+import asyncio
+import json
+from typing import Dict
+from google import genai
+from google.genai import types
+from chat_db.summary import cached_summary, recent_conversation
+from youtube.config import DEFAULT_SESSION_ID
+import os
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
+# ------------------------
+client = genai.Client(api_key=GOOGLE_API_KEY)
+
+ANSWER_TYPES = ("short", "detailed", "list", "yes/no", "definition", "step-by-step")
+
+# JSON-mode response shape
+PLAN_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "query_dev": {"type": "STRING"},
+        "question": {"type": "STRING"},
+        "answer_type": {"type": "STRING", "enum": list(ANSWER_TYPES)},
+        "history_need": {"type": "STRING", "enum": ["yes", "no"]},
+    },
+    "required": ["query_dev", "question", "answer_type", "history_need"],
+}
+
+
+def _conversation_context(session_id: str) -> str:
+    """Cached conversation summary, or the raw recent turns when none is cached yet."""
+    s = cached_summary(session_id)
+    if s:
+        return s
+    return recent_conversation(4, session_id) or "(no previous conversation)"
+
+
+async def plan_query(question: str, session_id: str = DEFAULT_SESSION_ID) -> Dict[str, str]:
+    """
+    Plan a user question in a single JSON-mode call on the async Gemini client.
+
+    Covers query translation, question framing and the conversation summary at once.
+    The conversation context is that of session_id.
+    Returns {"query_dev", "question", "answer_type", "history_need"}:
+      query_dev    - self-contained question as Hinglish in Devanagari (used for retrieval)
+      question     - refined, self-contained question (used for answering)
+      answer_type  - one of ANSWER_TYPES
+      history_need - "yes" if the question refers to the earlier conversation
+    """
+    context = await asyncio.to_thread(_conversation_context, session_id)
+
+    prompt = f"""
+You are an intelligent conversation analyzer for a YouTube video Q&A assistant.
+The video transcripts are mostly Hindi (Devanagari) mixed with English terms.
+
+Given the user's question and the context of the previous conversation, determine:
+
+1. history_need: "yes" if the question refers to the previous conversation, else "no".
+   - "yes" for pronouns or demonstratives without a clear subject ("it", "that", "this", "he", "they", "its"),
+     references like "as you mentioned", continuations ("also", "what else", "tell me more", "elaborate"),
+     and bare follow-ups ("why?", "how?").
+   - "no" for self-contained questions, new topics, greetings, "what is X", "explain Y".
+
+2. question: rewrite the question for clarity so it is fully independent of the chat history.
+   If history_need is "yes", use the conversation context to replace the missing reference
+   (e.g. "Who was he?" -> "Who was Albert Einstein?"). Do NOT change the meaning or answer it.
+
+3. query_dev: the same rewritten question as natural spoken Hinglish written in Devanagari script.
+   Keep technical terms in English but write them phonetically in Devanagari
+   (e.g. "what is cyborg?" -> "साइबॉर्ग क्या होता है?").
+
+4. answer_type: one of
+   - "short": quick factual answer ("What year did...", "Who is...", "How many...")
+   - "detailed": comprehensive explanation ("Explain how...", "Why does...")
+   - "list": multiple items ("What are the types of...", "Give me examples of...")
+   - "yes/no": binary question ("Is it...", "Can we...", "Does this...")
+   - "definition": concise definition ("What is...", "Define...")
+   - "step-by-step": process or instructions ("How to...", "Steps for...")
+
+Return ONLY a JSON object with the keys query_dev, question, answer_type, history_need.
+
+Conversation context:
+{context}
+
+User question:
+{question}
+""".strip()
+
+    try:
+        resp = await client.aio.models.generate_content(
+            model="gemini-2.0-flash",
+            contents=prompt,
+            config=types.GenerateContentConfig(
+                response_mime_type="application/json",
+                response_schema=PLAN_SCHEMA,
+            ),
+        )
+        plan = json.loads(resp.text)
+
+        answer_type = str(plan.get("answer_type", "")).strip().lower()
+        history_need = str(plan.get("history_need", "")).strip().lower()
+        refined = str(plan.get("question") or "").strip() or question
+
+        return {
+            "query_dev": str(plan.get("query_dev") or "").strip() or refined,
+            "question": refined,
+            "answer_type": answer_type if answer_type in ANSWER_TYPES else "detailed",
+            "history_need": history_need if history_need in ("yes", "no") else "no",
+        }
+    except Exception as e:
+        print(f"Error in plan_query: {e}")
+        # Fallback to original question
+        return {
+            "query_dev": question,
+            "question": question,
+            "answer_type": "detailed",
+            "history_need": "no",
+        }
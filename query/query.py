@@ -1,126 +1,201 @@
 # app/query.py  (SIMPLE & CLEAN VERSION – ONLY RETURNS TOP 4 CLOSEST MATCHES)
 
 from fastapi import APIRouter, HTTPException, Query
-from fastapi.responses import JSONResponse
-from typing import Optional
-from google import genai
-from google.genai import types
-from query.question import get_actual_question
-from chroma.chroma_store import _make_chroma_client  # Same function you already have!
-from query.answer import bot_answer,english
-from chat_db.databse import create_database,append_data
-import os
-from dotenv import load_dotenv
-
-# Load environment variables from .env file
-load_dotenv()
-
-GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
-router = APIRouter()
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, StreamingResponse
+from typing import Optional, AsyncIterator, List, Tuple
+import json
+from query.planner import plan_query
+from chroma.chroma_store import get_collection, session_collection_name
+from query.retrieval import select_context
+from youtube.config import (
+    RETRIEVAL_CANDIDATES,
+    DEFAULT_SESSION_ID,
+    SESSION_ID_PATTERN,
+    COLLECTION_NAME_PATTERN,
+)
+from embedding.chunk_utils import aembed_texts
+from query.answer import bot_answer,bot_answer_stream,english
+from chat_db.databse import create_database,queue_append
+from chat_db.summary import schedule_summary_refresh
 
-# SAME GEMINI MODEL USED DURING CHUNKING
-EMBED_MODEL = "gemini-embedding-001"
-EMBED_DIM = 768
-client = genai.Client(api_key=GOOGLE_API_KEY) # IMPORTANT: REPLACE YOUR KEY!
+router = APIRouter()
 
 create_database()
 
-def translate_query_to_hinglish(query: str) -> str:
-    """ Translate English query to Hinglish (Devanagari) for better matching with Hindi chunks. """ 
+async def get_query_embedding(text: str):
+    """Embed text using Gemini (same model as chunking), via the embedding cache."""
     try:
-        prompt = f""" Convert this English question into natural Hinglish written in Devanagari script.
-          Keep technical terms in English but write them phonetically in Devanagari. 
-          Make it sound like natural spoken Hindi-English mix. 
-          English question: {query} Return ONLY the Hinglish translation in Devanagari, nothing else.
-           ex- query - what is cyborg? the response - साइबॉर्ग क्या होता है?  
-           text texual respoce should be in hindi devnagri representation only""" 
-        response = client.models.generate_content( 
-            model="gemini-2.0-flash",
-            contents=prompt 
-            ) 
-        hinglish_query = response.text.strip() 
-        
-        return hinglish_query 
-    except Exception as e: print(f"Translation failed: {e}, using original query") 
-    return query
+        return (await aembed_texts([text]))[0]
+    except Exception as e:
+        raise RuntimeError(f"Gemini embedding failed: {e}")
 
 
+def _get_collection(collection_name: str, persist_dir: str, session_id: str = DEFAULT_SESSION_ID):
+    # Shared client + cached handle: no client construction on warm requests
+    return get_collection(session_collection_name(collection_name, session_id), persist_dir)
+
+
+def _parse_video_ids(video_ids: Optional[str]) -> List[str]:
+    return [v.strip() for v in (video_ids or "").split(",") if v.strip()]
 
-def get_query_embedding(text: str):
-    """Embed text using Gemini."""
-    try:
-        res = client.models.embed_content(
-            model=EMBED_MODEL,
-            contents=text,
-            config=types.EmbedContentConfig(output_dimensionality=EMBED_DIM)
-        )
-        return res.embeddings[0].values
-    except Exception as e:
-        raise RuntimeError(f"Gemini embedding failed: {e}")
 
+def _video_filter(video_ids: List[str]) -> Optional[dict]:
+    """Vector store where clause restricting the search to video_ids (None = whole collection)."""
+    if not video_ids:
+        return None
+    if len(video_ids) == 1:
+        return {"video_id": video_ids[0]}
+    return {"video_id": {"$in": video_ids}}
 
-@router.get("/query_chunks", summary="Get top 4 most relevant chunks")
-def query_chunks(
+
+async def retrieve_context(collection, q_dev: str, video_ids: Optional[List[str]] = None) -> Tuple[str, List[dict]]:
+    """
+    Embed the Devanagari query, pick diverse chunks from an over-fetched
+    candidate set (MMR), merge neighbouring chunks and pack them into the
+    context token budget.
+
+    video_ids, if given, restrict the search to those videos.
+    Returns (context, sources): sources lists the video_id, chunk_ids and
+    start_time of every span in the context.
+    """
+    q_emb = await get_query_embedding(q_dev)
+
+    result = await run_in_threadpool(
+        collection.query,
+        query_embeddings=[q_emb],
+        n_results=RETRIEVAL_CANDIDATES,
+        where=_video_filter(video_ids),
+        include=["documents", "metadatas", "embeddings"],
+    )
+
+    spans = select_context(q_emb, result)
+    sources = [{k: s[k] for k in ("video_id", "chunk_ids", "start_time")} for s in spans]
+    return " | ".join(s["text"] for s in spans), sources
+
+
+@router.get("/query_chunks", summary="Answer a question from the most relevant chunks")
+async def query_chunks(
     q: str = Query(..., description="Search query"),
-    collection_name: str = Query("video_chunks", description="ChromaDB collection name"),
-    persist_dir: str = Query("chromadb_store", description="ChromaDB folder")
+    collection_name: str = Query("video_chunks", pattern=COLLECTION_NAME_PATTERN, description="ChromaDB collection name"),
+    persist_dir: str = Query("chromadb_store", description="ChromaDB folder"),
+    session_id: str = Query(DEFAULT_SESSION_ID, pattern=SESSION_ID_PATTERN, description="Chat session id"),
+    video_ids: Optional[str] = Query(None, description="Comma-separated video ids to search (default: all)"),
 ):
     """
-    Return ONLY top 4 most similar chunks from ChromaDB.
-    No multi-query, no RAG, no history.
+    Answer a question from the most relevant, non-redundant chunks.
+
+    Gemini calls go through the async client, Chroma work is offloaded to
+    the threadpool and chat records are queued for the background writer,
+    so requests don't hold a worker thread while waiting on the LLM or disk.
     """
     try:
         if not q.strip():
             raise HTTPException(status_code=400, detail="Query text is empty")
 
         # === Load ChromaDB ===
-        client_db = _make_chroma_client(persist=True, persist_dir=persist_dir)
-        collection = client_db.get_collection(collection_name)
-
-        # === Embed Query ===
-        q_hinglish=translate_query_to_hinglish(q)
+        collection = await run_in_threadpool(_get_collection, collection_name, persist_dir, session_id)
 
-
-        q_dev, answer_type, history_need=get_actual_question(q_hinglish)
+        # === Plan Query (Devanagari query, refined question, answer type, history) ===
+        plan = await plan_query(q, session_id)
+        q_dev = plan["query_dev"]
+        question = plan["question"]
+        answer_type = plan["answer_type"]
+        history_need = plan["history_need"]
 
         
-        append_data("user",q)
+        queue_append("user", q, session_id)
   
 
         
-        q_emb = get_query_embedding(q_dev)
-
-        # === Query ChromaDB (Top-4 only) ===
-        result = collection.query(
-            query_embeddings=[q_emb],
-            n_results=4  # ← FIXED TO ONLY 4 RESULTS
-        )
-
-
-
-
-
-        docs = result.get("documents", [[]])[0]
-        ids = result.get("ids", [[]])[0]
-        distances = result.get("distances", [[]])[0] 
-
-
-        if docs:
-            data = " | ".join(docs[:4])   # up to 4 chunks
-        else:
-            data = ""
-
-        answer_h=bot_answer(q_dev,answer_type,history_need,data)  
-        answer=english(answer_h)
-        append_data("bot", answer)
+        # === Embed Query + Retrieve ===
+        data, sources = await retrieve_context(collection, q_dev, _parse_video_ids(video_ids))
+
+        # Answers come back in English; english() only calls Gemini if one slipped into Hindi
+        answer_h = await bot_answer(question, answer_type, history_need, data)
+        answer = await english(answer_h)
+        queue_append("bot", answer, session_id)
+        schedule_summary_refresh(session_id)
         return JSONResponse({
              
-            "question":q_dev,
+            "question":question,
+            "search_query":q_dev,
             "type":answer_type,
             "history":history_need,                
-            
+            "sources":sources,
             "answer":answer
         })
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+
+def _sse(event: str, payload: dict) -> str:
+    """Format one Server-Sent Event."""
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+@router.get("/query_chunks_stream", summary="Stream the answer as Server-Sent Events")
+async def query_chunks_stream(
+    q: str = Query(..., description="Search query"),
+    collection_name: str = Query("video_chunks", pattern=COLLECTION_NAME_PATTERN, description="ChromaDB collection name"),
+    persist_dir: str = Query("chromadb_store", description="ChromaDB folder"),
+    session_id: str = Query(DEFAULT_SESSION_ID, pattern=SESSION_ID_PATTERN, description="Chat session id"),
+    video_ids: Optional[str] = Query(None, description="Comma-separated video ids to search (default: all)"),
+):
+    """
+    Streaming variant of /query_chunks.
+
+    Emits "stage" events (planning, retrieving, answering), then "token"
+    events as answer text arrives from Gemini, and a final "done" event with
+    the full answer (or an "error" event). The "answering" stage and "done"
+    events carry the sources of the context. The answer is queued for the
+    chat log when the stream closes, even if the client disconnects early.
+    """
+    if not q.strip():
+        raise HTTPException(status_code=400, detail="Query text is empty")
+
+    async def events() -> AsyncIterator[str]:
+        parts = []
+        try:
+            yield _sse("stage", {"stage": "planning"})
+            collection = await run_in_threadpool(_get_collection, collection_name, persist_dir, session_id)
+
+            plan = await plan_query(q, session_id)
+            queue_append("user", q, session_id)
+            yield _sse("stage", {
+                "stage": "retrieving",
+                "question": plan["question"],
+                "search_query": plan["query_dev"],
+                "type": plan["answer_type"],
+                "history": plan["history_need"],
+            })
+
+            data, sources = await retrieve_context(collection, plan["query_dev"], _parse_video_ids(video_ids))
+            yield _sse("stage", {"stage": "answering", "sources": sources})
+
+            async for text in bot_answer_stream(plan["question"], plan["answer_type"], plan["history_need"], data):
+                parts.append(text)
+                yield _sse("token", {"text": text})
+
+            # Same English guarantee as /query_chunks; no extra call for Latin-script answers
+            answer = await english("".join(parts))
+            parts = [answer]
+            yield _sse("done", {"answer": answer, "sources": sources})
+        except Exception as e:
+            print(f"Error in query_chunks_stream: {e}")
+            yield _sse("error", {"detail": str(e)})
+        finally:
+            # Runs on normal completion, errors and client disconnects alike.
+            # Not awaited: an await here would be cancelled along with a disconnected stream.
+            if parts:
+                queue_append("bot", "".join(parts), session_id)
+                schedule_summary_refresh(session_id)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,161 @@
+# retrieval.py - diverse chunk selection and context packing for the answer prompt
+
+from typing import Any, Dict, List, Sequence
+import numpy as np
+from youtube.text_utils import overlap_words
+from youtube.config import (
+    RETRIEVAL_TOP_K,
+    MMR_LAMBDA,
+    CONTEXT_TOKEN_BUDGET,
+    CONTEXT_CHARS_PER_TOKEN,
+)
+
+
+def _unit_rows(vectors) -> np.ndarray:
+    m = np.asarray(vectors, dtype=np.float32)
+    if m.ndim == 1:
+        m = m[None, :]
+    norms = np.linalg.norm(m, axis=1, keepdims=True)
+    return m / np.where(norms == 0, 1, norms)
+
+
+def mmr_select(
+    query_embedding: Sequence[float],
+    candidate_embeddings,
+    k: int = RETRIEVAL_TOP_K,
+    lambda_mult: float = MMR_LAMBDA,
+) -> List[int]:
+    """
+    Maximal marginal relevance: pick k candidate indices that are similar to
+    the query but not to the candidates already picked (cosine similarity).
+    """
+    n = len(candidate_embeddings)
+    if n == 0 or k <= 0:
+        return []
+
+    cands = _unit_rows(candidate_embeddings)
+    relevance = cands @ _unit_rows(query_embedding)[0]
+    pairwise = cands @ cands.T
+
+    selected = [int(np.argmax(relevance))]
+    # Highest similarity of each candidate to anything selected so far
+    redundancy = pairwise[selected[0]].copy()
+    while len(selected) < min(k, n):
+        score = lambda_mult * relevance - (1 - lambda_mult) * redundancy
+        score[selected] = -np.inf
+        best = int(np.argmax(score))
+        selected.append(best)
+        np.maximum(redundancy, pairwise[best], out=redundancy)
+    return selected
+
+
+def merge_adjacent(chunks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Merge chunks of the same video with consecutive chunk_ids into one span.
+
+    chunks: [{"text", "video_id", "chunk_id", ...}] in rank order.
+    The words shared by neighbouring chunks (the chunk overlap) are kept once.
+    Spans are returned in the rank order of their best chunk, with the text
+    in transcript order.
+    """
+    order = {id(c): rank for rank, c in enumerate(chunks)}
+    ordered = sorted(chunks, key=lambda c: (str(c.get("video_id")), c.get("chunk_id") or 0))
+
+    spans = []
+    for c in ordered:
+        last = spans[-1] if spans else None
+        if (
+            last is not None
+            and last["video_id"] == c.get("video_id")
+            and c.get("chunk_id") is not None
+            and last["chunk_ids"][-1] is not None
+            and last["chunk_ids"][-1] + 1 == c["chunk_id"]
+        ):
+            prev_words = last["words"]
+            words = c["text"].split()
+            k = overlap_words(prev_words, words)
+            prev_words.extend(words[k:])
+            last["chunk_ids"].append(c["chunk_id"])
+            last["rank"] = min(last["rank"], order[id(c)])
+            continue
+
+        spans.append({
+            "video_id": c.get("video_id"),
+            "chunk_ids": [c.get("chunk_id")],
+            "start_time": c.get("start_time"),
+            "words": c["text"].split(),
+            "rank": order[id(c)],
+        })
+
+    spans.sort(key=lambda s: s["rank"])
+    return [
+        {
+            "video_id": s["video_id"],
+            "chunk_ids": s["chunk_ids"],
+            "start_time": s["start_time"],
+            "text": " ".join(s["words"]),
+        }
+        for s in spans
+    ]
+
+
+def estimate_tokens(text: str) -> int:
+    return -(-len(text) // CONTEXT_CHARS_PER_TOKEN)
+
+
+def pack_context(spans: List[Dict[str, Any]], token_budget: int = CONTEXT_TOKEN_BUDGET) -> List[Dict[str, Any]]:
+    """
+    Take spans in rank order until token_budget is used up.
+
+    The span that crosses the budget is cut at a word boundary, so the best
+    span is always included, if only in part.
+    """
+    packed = []
+    remaining = token_budget
+    for s in spans:
+        cost = estimate_tokens(s["text"])
+        if cost > remaining:
+            cut = s["text"][:remaining * CONTEXT_CHARS_PER_TOKEN].rsplit(" ", 1)[0]
+            if cut:
+                packed.append({**s, "text": cut})
+            break
+        packed.append(s)
+        remaining -= cost
+    return packed
+
+
+def select_context(
+    query_embedding: Sequence[float],
+    result: Dict[str, List[list]],
+    k: int = RETRIEVAL_TOP_K,
+    lambda_mult: float = MMR_LAMBDA,
+    token_budget: int = CONTEXT_TOKEN_BUDGET,
+) -> List[Dict[str, Any]]:
+    """
+    Turn a vector store query result (with documents, metadatas and embeddings
+    of the candidates) into the context spans for the answer prompt:
+    [{"video_id", "chunk_ids", "start_time", "text"}] in rank order.
+    """
+    docs = (result.get("documents") or [[]])[0]
+    if not docs:
+        return []
+    metas = (result.get("metadatas") or [[None] * len(docs)])[0]
+    embs = result.get("embeddings")
+    # Chroma may hand back embeddings as NumPy arrays, so no truthiness tests here
+    embs = embs[0] if embs is not None and len(embs) else None
+
+    if embs is not None and len(embs) == len(docs):
+        picked = mmr_select(query_embedding, embs, k, lambda_mult)
+    else:
+        picked = list(range(min(k, len(docs))))
+
+    chunks = [
+        {
+            "text": docs[i],
+            "video_id": (metas[i] or {}).get("video_id"),
+            "chunk_id": (metas[i] or {}).get("chunk_id"),
+            "start_time": (metas[i] or {}).get("start_time"),
+        }
+        for i in picked
+    ]
+    return pack_context(merge_adjacent(chunks), token_budget)
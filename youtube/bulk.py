@@ -0,0 +1,374 @@
+"""
+bulk.py - Playlist / channel bulk ingest
+
+A playlist or channel URL is expanded with yt-dlp's flat extraction, the
+transcripts of its videos are fetched concurrently, and the chunks of all
+videos are embedded in shared batches and appended to one collection.
+
+Also usable from the command line:
+
+    python -m youtube.bulk "https://www.youtube.com/playlist?list=..." --langs hi,en
+"""
+import argparse
+import json
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, Iterator, List, Optional
+
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+from yt_dlp import YoutubeDL
+
+from youtube.config import (
+    COOKIES_FILE,
+    BULK_MAX_VIDEOS,
+    BULK_TRANSCRIPT_WORKERS,
+    DEFAULT_CHUNK_SIZE,
+    DEFAULT_CHUNK_OVERLAP,
+    DEFAULT_COLLECTION_NAME,
+    DEFAULT_PERSIST_DIR,
+    DEFAULT_SESSION_ID,
+    SESSION_ID_PATTERN,
+    COLLECTION_NAME_PATTERN,
+)
+from youtube.youtube_service import fetch_youtube_transcript
+from embedding.chunk_utils import (
+    iter_chunk_records,
+    embed_chunk_records,
+    iter_with_progress,
+    ignore_progress,
+    chunk_fingerprint,
+    count_chunks,
+)
+from chroma.chroma_store import current_video_chunks, replace_video_chunks, session_collection_name
+from chat_db.databse import delete_all_records
+
+bulk_router = APIRouter()
+
+
+def expand_video_entries(url: str, limit: int = BULK_MAX_VIDEOS) -> List[dict]:
+    """
+    Expand a playlist, channel or single video URL into [{video_id, title, url}].
+
+    Uses flat extraction, so no per-video metadata request is made. Channel
+    tabs (videos, shorts, ...) are expanded one level deep.
+    """
+    opts = {
+        "quiet": True,
+        "no_warnings": True,
+        "extract_flat": "in_playlist",
+        "playlistend": limit,
+        "cookiefile": str(COOKIES_FILE),
+    }
+
+    videos = []
+    seen = set()
+
+    def walk(ydl: YoutubeDL, info: dict, depth: int):
+        entries = info.get("entries")
+        if entries is None:
+            vid = info.get("id")
+            if vid and vid not in seen and len(videos) < limit:
+                seen.add(vid)
+                videos.append({
+                    "video_id": vid,
+                    "title": info.get("title"),
+                    "url": info.get("webpage_url") or f"https://www.youtube.com/watch?v={vid}",
+                })
+            return
+
+        for entry in entries:
+            if len(videos) >= limit:
+                return
+            if not entry:
+                continue
+            if entry.get("ie_key") == "YoutubeTab":
+                # Channel root: each entry is a tab that needs its own flat extraction
+                if depth < 1:
+                    walk(ydl, ydl.extract_info(entry["url"], download=False), depth + 1)
+                continue
+            walk(ydl, {
+                "id": entry.get("id"),
+                "title": entry.get("title"),
+                "webpage_url": entry.get("webpage_url") or entry.get("url"),
+            }, depth)
+
+    try:
+        with YoutubeDL(opts) as ydl:
+            walk(ydl, ydl.extract_info(url, download=False), 0)
+    except Exception as e:
+        print(f"Error expanding {url}: {e}")
+        raise RuntimeError(f"Failed to expand {url}: {e}")
+
+    print(f"Expanded {url} into {len(videos)} videos")
+    return videos
+
+
+def _fetch_transcript(video: dict, preferred: List[str], report: dict) -> dict:
+    """Worker: fetch one video's transcript and record how long it took."""
+    report["status"] = "fetching"
+    started = time.time()
+    try:
+        res = fetch_youtube_transcript(video["url"], preferred_langs=preferred)
+    finally:
+        report["fetch_seconds"] = round(time.time() - started, 2)
+
+    if res.get("status") != "ok":
+        raise RuntimeError(res.get("message", "No captions found"))
+    if not res.get("paragraphs"):
+        raise RuntimeError("No paragraphs generated from captions")
+    return res
+
+
+def ingest_playlist(
+    url: str,
+    langs: Optional[str] = "hi,en",
+    chunk_size: Optional[int] = DEFAULT_CHUNK_SIZE,
+    overlap: Optional[int] = DEFAULT_CHUNK_OVERLAP,
+    collection_name: str = DEFAULT_COLLECTION_NAME,
+    persist_dir: str = DEFAULT_PERSIST_DIR,
+    reset_collection: bool = False,
+    limit: int = BULK_MAX_VIDEOS,
+    progress: Optional[Callable[..., None]] = None,
+    session_id: str = DEFAULT_SESSION_ID,
+) -> dict:
+    """
+    Ingest every video of a playlist or channel into one ChromaDB collection.
+
+    Transcripts are fetched on a pool of BULK_TRANSCRIPT_WORKERS threads and
+    each one is chunked as soon as it arrives; chunks of all videos share
+    embedding batches and are appended to the collection as a single stream.
+    Videos that fail are reported per video instead of failing the whole run;
+    videos already stored with the same transcript and chunk parameters are
+    skipped. Chunks go to the session's own copy of collection_name.
+
+    progress, if given, is called as progress(stage, chunks_embedded, snapshot),
+    where snapshot is {"videos": [...]} with the current per-video reports.
+    """
+    progress = progress or ignore_progress
+    try:
+        collection_name = session_collection_name(collection_name, session_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    preferred = [l.strip() for l in (langs or "").split(",") if l.strip()] or ["hi", "en"]
+
+    progress("expanding", 0)
+    try:
+        videos = expand_video_entries(url, limit=limit)
+    except RuntimeError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not videos:
+        raise HTTPException(status_code=404, detail=f"No videos found for {url}")
+
+    if reset_collection:
+        delete_all_records(session_id)
+
+    reports: Dict[str, dict] = {
+        v["video_id"]: {
+            "video_id": v["video_id"],
+            "title": v["title"],
+            "status": "queued",
+            "chunks_created": 0,
+            "error": None,
+            "fetch_seconds": None,
+        }
+        for v in videos
+    }
+    counts = {"transcripts_done": 0, "chunks_embedded": 0}
+    # video_id -> fingerprint of the chunks being stored, filled as transcripts arrive
+    fingerprints: Dict[str, str] = {}
+    started = time.time()
+
+    def report_progress(chunks_embedded: Optional[int] = None):
+        if chunks_embedded is not None:
+            counts["chunks_embedded"] = chunks_embedded
+        # Copies: transcript workers keep updating the reports while this is serialized
+        snapshot = {"videos": [dict(r) for r in reports.values()]}
+        progress(
+            f"embedding ({counts['transcripts_done']}/{len(videos)} transcripts)",
+            counts["chunks_embedded"],
+            snapshot,
+        )
+
+    pool = ThreadPoolExecutor(max_workers=BULK_TRANSCRIPT_WORKERS, thread_name_prefix="bulk-transcript")
+    futures = {
+        pool.submit(_fetch_transcript, v, preferred, reports[v["video_id"]]): v
+        for v in videos
+    }
+
+    def records() -> Iterator[dict]:
+        # Chunk each transcript in completion order, so slow videos don't hold up the rest
+        for future in as_completed(futures):
+            video = futures[future]
+            report = reports[video["video_id"]]
+            counts["transcripts_done"] += 1
+
+            try:
+                res = future.result()
+            except Exception as e:
+                report["status"] = "failed"
+                report["error"] = str(e)
+                print(f"[{video['video_id']}] transcript failed: {e}")
+                report_progress()
+                continue
+
+            report.update(
+                caption_type=res.get("type"),
+                language=res.get("lang"),
+                paragraphs_count=len(res["paragraphs"]),
+                from_cache=bool(res.get("from_cache")),
+            )
+            print(f"[{video['video_id']}] transcript ready ({counts['transcripts_done']}/{len(videos)})")
+
+            fingerprint = chunk_fingerprint(res["paragraphs"], chunk_size, overlap)
+            existing = current_video_chunks(
+                video["video_id"], fingerprint, count_chunks(res["paragraphs"], chunk_size, overlap),
+                collection_name, persist_dir, reset_collection,
+            )
+            if existing:
+                report.update(status="skipped", chunks_created=existing)
+                report_progress()
+                continue
+
+            fingerprints[video["video_id"]] = fingerprint
+            report["status"] = "embedding"
+            report_progress()
+
+            yield from iter_chunk_records(
+                res["paragraphs"],
+                chunk_size_words=chunk_size,
+                overlap_words=overlap,
+                filename=f"{video['video_id']}.txt",
+                video_id=video["video_id"],
+                paragraph_starts=res.get("paragraph_starts"),
+                fingerprint=fingerprint,
+            )
+
+    def counted(chunks: Iterator[dict]) -> Iterator[dict]:
+        for chunk in chunks:
+            reports[chunk["video_id"]]["chunks_created"] += 1
+            yield chunk
+
+    error = None
+    chunks_created = 0
+    try:
+        # Replaces each video's earlier chunks only once the whole stream is stored
+        chunks_created = sum(replace_video_chunks(
+            iter_with_progress(counted(embed_chunk_records(records())), report_progress),
+            fingerprints,
+            collection_name=collection_name,
+            persist_dir=persist_dir,
+            reset_collection=reset_collection,
+        ).values())
+    except Exception as e:
+        print(f"Error creating / storing chunk embeddings: {traceback.format_exc()}")
+        error = f"Chunk embedding/storage failed: {e}"
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    for report in reports.values():
+        if report["status"] == "embedding" and error is None:
+            report["status"] = "stored"
+        elif report["status"] not in ("failed", "skipped"):
+            report["status"] = "failed"
+            report["error"] = error or "Not processed"
+
+    failed = [r for r in reports.values() if r["status"] == "failed"]
+    skipped = sum(1 for r in reports.values() if r["status"] == "skipped")
+    stored = len(reports) - len(failed) - skipped
+    if not stored and not skipped:
+        raise HTTPException(status_code=502, detail={
+            "message": error or "No video of the playlist could be ingested",
+            "videos": list(reports.values()),
+        })
+
+    print(f"Stored {chunks_created} chunks from {stored}/{len(videos)} videos in '{collection_name}'")
+    progress("completed", chunks_created)
+
+    return {
+        "status": "ok" if not failed else "partial",
+        "url": url,
+        "videos_total": len(videos),
+        "videos_stored": stored,
+        "videos_skipped": skipped,
+        "videos_failed": len(failed),
+        "chunks_created": chunks_created,
+        "session_id": session_id,
+        "collection_name": collection_name,
+        "persist_dir": persist_dir,
+        "reset_collection": reset_collection,
+        "elapsed_seconds": round(time.time() - started, 2),
+        "error": error,
+        "videos": list(reports.values()),
+    }
+
+
+@bulk_router.post(
+    "/yt_playlist_ingest",
+    summary="Ingest every video of a playlist or channel into one ChromaDB collection"
+)
+async def yt_playlist_ingest(
+    url: str = Query(..., description="YouTube playlist, channel or video URL"),
+    langs: Optional[str] = Query("hi,en", description="Comma-separated preferred languages"),
+    chunk_size: Optional[int] = Query(DEFAULT_CHUNK_SIZE, description="Words per chunk"),
+    overlap: Optional[int] = Query(DEFAULT_CHUNK_OVERLAP, description="Overlapping words between chunks"),
+    collection_name: str = Query(DEFAULT_COLLECTION_NAME, pattern=COLLECTION_NAME_PATTERN, description="ChromaDB collection name"),
+    persist_dir: str = Query(DEFAULT_PERSIST_DIR, description="ChromaDB persistence directory"),
+    reset_collection: bool = Query(False, description="Reset the ChromaDB collection before inserting"),
+    limit: int = Query(BULK_MAX_VIDEOS, description="Maximum number of videos to ingest"),
+    session_id: str = Query(DEFAULT_SESSION_ID, pattern=SESSION_ID_PATTERN, description="Chat session id"),
+):
+    return await run_in_threadpool(
+        ingest_playlist,
+        url=url,
+        langs=langs,
+        chunk_size=chunk_size,
+        overlap=overlap,
+        collection_name=collection_name,
+        persist_dir=persist_dir,
+        reset_collection=reset_collection,
+        limit=limit,
+        session_id=session_id,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk-ingest a YouTube playlist or channel into ChromaDB")
+    parser.add_argument("url", help="YouTube playlist, channel or video URL")
+    parser.add_argument("--langs", default="hi,en", help="Comma-separated preferred languages")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="Words per chunk")
+    parser.add_argument("--overlap", type=int, default=DEFAULT_CHUNK_OVERLAP, help="Overlapping words between chunks")
+    parser.add_argument("--collection", default=DEFAULT_COLLECTION_NAME, help="ChromaDB collection name")
+    parser.add_argument("--persist-dir", default=DEFAULT_PERSIST_DIR, help="ChromaDB persistence directory")
+    parser.add_argument("--reset", action="store_true", help="Reset the collection before inserting")
+    parser.add_argument("--limit", type=int, default=BULK_MAX_VIDEOS, help="Maximum number of videos")
+    parser.add_argument("--session", default=DEFAULT_SESSION_ID, help="Chat session id")
+    args = parser.parse_args()
+
+    def print_progress(stage: str, chunks_embedded: int = 0, snapshot: Optional[dict] = None):
+        print(f"  {stage}: {chunks_embedded} chunks")
+
+    try:
+        result = ingest_playlist(
+            url=args.url,
+            langs=args.langs,
+            chunk_size=args.chunk_size,
+            overlap=args.overlap,
+            collection_name=args.collection,
+            persist_dir=args.persist_dir,
+            reset_collection=args.reset,
+            limit=args.limit,
+            progress=print_progress,
+            session_id=args.session,
+        )
+    except (HTTPException, ValueError) as e:
+        print(json.dumps(getattr(e, "detail", str(e)), ensure_ascii=False, indent=2))
+        raise SystemExit(1)
+
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -21,10 +21,21 @@ OUT_DIR.mkdir(exist_ok=True)
 # Caption processing defaults
 MAX_PARA_CHARS = 300
 MAX_LINES_WITHOUT_PUNCT = 4
+# Rolling auto-captions: minimum suffix/prefix overlap (in words) treated as a repeat
+DEDUP_MIN_OVERLAP_WORDS = 2
 
 # YouTube-DL settings
 YOUTUBE_CLIENTS = [None, "web_html5", "web", "desktop", "android", "ios", "tv_html5"]
 MAX_CLIENTS_TRY = 7
+# Player clients downloaded concurrently when racing for captions
+YOUTUBE_CLIENT_RACE_WORKERS = 3
+# Caption track formats to fetch, in order of preference (VTT is the fallback)
+CAPTION_FORMATS = ["json3", "vtt"]
+
+# Playlist / channel bulk ingest
+BULK_MAX_VIDEOS = 200
+# Videos whose transcripts are fetched concurrently
+BULK_TRANSCRIPT_WORKERS = 4
 
 # Default preferred languages
 DEFAULT_LANGUAGES = ["en", "hi", "en-US", "en-GB"]
@@ -34,6 +45,80 @@ DEFAULT_CHUNK_SIZE = 300
 DEFAULT_CHUNK_OVERLAP = 50
 DEFAULT_OUTPUT_DIR = "chunks"
 
+# Embedding request defaults
+# Gemini accepts at most 100 contents per embed_content request
+EMBED_BATCH_SIZE = 100
+
+# Embedding worker pool (tune against the Gemini quota)
+EMBED_MAX_WORKERS = 4
+EMBED_TIMEOUT_S = 30
+EMBED_MAX_RETRIES = 5
+EMBED_BACKOFF_BASE_S = 1.0
+EMBED_BACKOFF_MAX_S = 30.0
+
+# Persistent embedding cache (SQLite, LRU-evicted)
+EMBED_CACHE_PATH = "embedding_cache.db"
+EMBED_CACHE_MAX_ENTRIES = 50000
+
 # ChromaDB defaults
 DEFAULT_COLLECTION_NAME = "video_chunks"
 DEFAULT_PERSIST_DIR = "chromadb_store"
+# Chunks per collection.add call when streaming an ingest into ChromaDB
+CHROMA_ADD_BATCH_SIZE = 100
+# Vector store backend: "chroma" (ChromaDB) or "numpy" (in-process exact search)
+VECTOR_BACKENDS = ("chroma", "numpy")
+VECTOR_BACKEND = "chroma"
+# Save NumPy collections as <persist_dir>/numpy/<collection>.npy/.json
+NUMPY_STORE_PERSIST = True
+
+# Retrieval: MMR over an over-fetched candidate set, then a context token budget
+RETRIEVAL_CANDIDATES = 20
+RETRIEVAL_TOP_K = 4
+# 1.0 = pure relevance, 0.0 = pure diversity
+MMR_LAMBDA = 0.7
+# Rough characters per Gemini token for mixed Devanagari / English text
+CONTEXT_CHARS_PER_TOKEN = 3
+# Characters per transcript word, spaces included (sample Hindi captions: ~4.6;
+# 6 leaves room for denser Devanagari)
+CONTEXT_CHARS_PER_WORD = 6
+# Approximate tokens of retrieved context handed to the answer prompt: room for
+# RETRIEVAL_TOP_K full default-size chunks (4 x 300 words ~ 2400 tokens), so the
+# budget only trims when chunks are larger than the defaults
+CONTEXT_TOKEN_BUDGET = RETRIEVAL_TOP_K * DEFAULT_CHUNK_SIZE * CONTEXT_CHARS_PER_WORD // CONTEXT_CHARS_PER_TOKEN
+
+# Chat sessions: each session has its own chat history and its own collections
+# (<collection>__<session_id>); the default session uses the unscoped names
+DEFAULT_SESSION_ID = "default"
+SESSION_ID_PATTERN = r"^[A-Za-z0-9](?:[A-Za-z0-9-]{0,62}[A-Za-z0-9])?$"
+# Collection names: alphanumeric runs joined by single ".", "_" or "-", so a
+# name can never contain the "__" that separates it from a session id
+COLLECTION_NAME_PATTERN = r"^[A-Za-z0-9]+(?:[._-][A-Za-z0-9]+)*$"
+
+# Chat history database (one pooled connection per thread, WAL)
+CHAT_DB_BUSY_TIMEOUT_MS = 5000
+# Records inserted per transaction by the background chat-log writer
+CHAT_WRITE_BATCH_MAX = 200
+# Queued chat records before queue_append blocks (bounds how long a read waits
+# for its own session's writes when appends outpace the disk)
+CHAT_WRITE_QUEUE_MAX = 2000
+# Conversation summary: newest records folded into the stored summary per refresh
+SUMMARY_RECORDS = 4
+SUMMARY_REFRESH_WORKERS = 2
+
+# Background ingest jobs
+JOBS_DB_PATH = "ingest_jobs.db"
+JOB_WORKERS = 2
+# A running job's owner refreshes its heartbeat every JOB_HEARTBEAT_S; a job
+# whose heartbeat is older than JOB_LEASE_S has lost its worker and is requeued
+JOB_HEARTBEAT_S = 15
+JOB_LEASE_S = 60
+
+# Persistent transcript cache (SQLite), keyed by (video_id, lang, caption_type)
+TRANSCRIPT_CACHE_PATH = "transcript_cache.db"
+TRANSCRIPT_CACHE_TTL_S = 7 * 24 * 3600
+TRANSCRIPT_CACHE_MAX_BYTES = 200 * 1024 * 1024
+
+# Supadata async transcript job polling
+SUPADATA_POLL_DEADLINE_S = 60
+SUPADATA_POLL_INITIAL_S = 1.0
+SUPADATA_POLL_MAX_S = 8.0
@@ -1,10 +1,11 @@
+import asyncio
 import re
-import time
 import traceback
 from pathlib import Path
-from typing import Optional, List
+from typing import Optional, List, Callable, Dict, Tuple
 
 from fastapi import APIRouter, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import JSONResponse
 
 # ⛔️ OLD: direct YouTube transcript fetch (causing IP issues on Render)
@@ -17,11 +18,24 @@ from youtube.config import (
     DEFAULT_CHUNK_OVERLAP,
     DEFAULT_COLLECTION_NAME,
     DEFAULT_PERSIST_DIR,
+    SUPADATA_POLL_DEADLINE_S,
+    SUPADATA_POLL_INITIAL_S,
+    SUPADATA_POLL_MAX_S,
+    DEFAULT_SESSION_ID,
+    SESSION_ID_PATTERN,
+    COLLECTION_NAME_PATTERN,
 )
-from embedding.chunk_utils import create_chunks_from_paragraphs
-from chroma.chroma_store import store_embeddings_in_chroma
+from embedding.chunk_utils import (
+    iter_embedded_chunks,
+    iter_with_progress,
+    ignore_progress,
+    chunk_fingerprint,
+    count_chunks,
+)
+from chroma.chroma_store import current_video_chunks, replace_video_chunks, session_collection_name
 from chat_db.databse import delete_all_records
-from youtube.file_utils import clear_out_dir
+from youtube.youtube_service import extract_video_id
+from youtube.transcript_cache import get_transcript, put_transcript
 
 # ✅ NEW: Supadata transcript service (works around YouTube IP blocking)
 from supadata import Supadata
@@ -32,81 +46,75 @@ supadata = Supadata(api_key=SUPADATA_API_KEY)
 
 router = APIRouter()
 
+# Supadata jobs still running when a request gave up, keyed by (video_id, lang),
+# so the next request for the same video (in any URL form) resumes the job
+# instead of starting over
+_pending_supadata_jobs: Dict[Tuple[str, str], str] = {}
 
-# --- helper: extract video id from any youtube url or direct id ---
-def extract_video_id(url_or_id: str) -> str:
-    """
-    Accepts full YouTube URL or plain video id and returns the video id.
-    Examples:
-      https://youtu.be/vuOx32ypfGY?si=...
-      https://www.youtube.com/watch?v=vuOx32ypfGY&ab_channel=...
-      vuOx32ypfGY
-    """
-    u = url_or_id.strip()
 
-    # already looks like an id (no slash, no 'http')
-    if "http://" not in u and "https://" not in u and "/" not in u:
-        return u
+class TranscriptPending(Exception):
+    """Raised when a Supadata transcript job is still running at the polling deadline."""
 
-    if "v=" in u:
-        return u.split("v=")[1].split("&")[0]
+    def __init__(self, job_id: str, status: str):
+        super().__init__(f"Transcript job {job_id} still {status}")
+        self.job_id = job_id
+        self.status = status
 
-    # youtu.be/ID?...
-    return u.split("/")[-1].split("?")[0]
 
+# caption_type under which Supadata transcripts are cached (yt-dlp uses auto/manual)
+SUPADATA_CAPTION_TYPE = "supadata"
 
-# --- main endpoint ---
-@router.get(
-    "/yt_url_chunks_inmemory",
-    summary="My Application Old new ",
-)
-def yt_url_chunks_inmemory(
-    url: str = Query(..., description="YouTube URL or video id"),
-    langs: Optional[str] = Query("hi,en", description="Comma-separated preferred languages"),
-    chunk_size: Optional[int] = Query(DEFAULT_CHUNK_SIZE, description="Words per chunk"),
-    overlap: Optional[int] = Query(DEFAULT_CHUNK_OVERLAP, description="Overlapping words between chunks"),
-    collection_name: str = Query(DEFAULT_COLLECTION_NAME, description="ChromaDB collection name"),
-    persist_dir: str = Query(DEFAULT_PERSIST_DIR, description="ChromaDB persistence directory"),
-    reset_collection: bool = Query(True, description="Reset the ChromaDB collection before inserting"),
-):
-    """
-    Fetch YouTube transcript via Supadata,
-    clean it into paragraphs, create overlapping chunks,
-    generate embeddings, and store them into ChromaDB.
-    """
 
-    # optional: if you still want to clear chat history
-    delete_all_records()
+# --- helper: resolve request options shared by the endpoint and jobs ---
+def _prepare_ingest(url: str, langs: Optional[str]) -> Tuple[str, str]:
+    """Validate the request and return (video_id, chosen_lang)."""
+    # Parse preferred languages from query
+    preferred = [l.strip() for l in (langs or "").split(",") if l.strip()]
+    if not preferred:
+        preferred = ["hi", "en"]
 
-    try:
-        # Clean any temp/output dir you had before
-        print("Cleaning output directory...")
-        clear_out_dir()
+    print(f"Using preferred languages: {preferred}")
 
-        # Parse preferred languages from query
-        preferred = [l.strip() for l in langs.split(",") if l.strip()]
-        if not preferred:
-            preferred = ["hi", "en"]
+    # Validate URL / ID
+    if not url.strip():
+        raise HTTPException(status_code=400, detail="URL or video id is required")
 
-        print(f"Using preferred languages: {preferred}")
+    # Extract video_id for filenames/metadata, but Supadata will use full URL
+    video_id = extract_video_id(url)
+    print(f"Resolved video_id = {video_id}")
 
-        # Validate URL / ID
-        if not url.strip():
-            raise HTTPException(status_code=400, detail="URL or video id is required")
+    # choose first preferred language if possible, fallback to 'en'
+    chosen_lang = preferred[0] if preferred else "en"
+    return video_id, chosen_lang
 
-        # Extract video_id for filenames/metadata, but Supadata will use full URL
-        video_id = extract_video_id(url)
-        print(f"Resolved video_id = {video_id}")
 
-        # ---- FETCH TRANSCRIPT VIA SUPADATA (new logic) ----
-        try:
-            # choose first preferred language if possible, fallback to 'en'
-            chosen_lang = preferred[0] if preferred else "en"
+# --- Supadata transcript fetch with non-blocking job polling ---
+async def fetch_supadata_transcript(
+    url: str,
+    lang: str,
+    job_id: Optional[str] = None,
+    deadline_s: float = SUPADATA_POLL_DEADLINE_S,
+) -> Tuple[str, str, Optional[str]]:
+    """
+    Fetch a transcript from Supadata and return (raw_text, status, job_id).
+
+    Async jobs are polled with asyncio.sleep and a growing delay, so many
+    pending transcripts share one event loop instead of a sleeping thread each.
+    If the job is still running at the deadline, TranscriptPending is raised
+    and the job is remembered so a later call for the same video/lang (or with
+    job_id) resumes it. A job whose status cannot be polled is forgotten, so
+    the next call starts a fresh one instead of resuming a dead job.
+    """
+    key = (extract_video_id(url), lang)
+    job_id = job_id or _pending_supadata_jobs.get(key)
 
+    if not job_id:
+        try:
             # Important: pass the original URL (not only video_id)
-            transcript_result = supadata.transcript(
+            transcript_result = await asyncio.to_thread(
+                supadata.transcript,
                 url=url,
-                lang=chosen_lang,
+                lang=lang,
                 text=True,
                 mode="auto",  # 'native', 'auto', or 'generate'
             )
@@ -118,54 +126,98 @@ def yt_url_chunks_inmemory(
                 detail=f"Transcript service error: {str(e)}",
             )
 
-        # ---- RESOLVE TRANSCRIPT TEXT FROM SUPADATA RESPONSE ----
-        raw_text = ""
-        status = "unknown"
-
         # Case 1: direct string
         if isinstance(transcript_result, str):
-            status = "completed"
-            raw_text = transcript_result
+            return transcript_result, "completed", None
 
         # Case 2: object with 'content'
-        elif hasattr(transcript_result, "content"):
-            status = "completed"
-            raw_text = transcript_result.content
+        if hasattr(transcript_result, "content"):
+            return transcript_result.content, "completed", None
 
         # Case 3: async job, we need to poll get_job_status
-        elif hasattr(transcript_result, "job_id"):
-            job_id = transcript_result.job_id
-            print(f"Supadata returned job_id={job_id}, polling for completion...")
-
-            # simple polling loop (up to ~20 seconds)
-            for _ in range(10):
-                job = supadata.transcript.get_job_status(job_id)
-                status = getattr(job, "status", "unknown")
-                print(f"[Supadata job poll] status={status}")
-
-                if status == "completed":
-                    raw_text = getattr(job, "content", "")
-                    break
-                elif status in ("failed", "error"):
-                    raise HTTPException(
-                        status_code=500,
-                        detail=f"Transcript job failed with status: {status}",
-                    )
-
-                time.sleep(2)
-
-            if not raw_text:
-                # we didn't get a completed transcript within polling limit
-                raise HTTPException(
-                    status_code=504,
-                    detail=f"Transcript job did not complete in time (last status: {status})",
-                )
-
-        else:
+        if not hasattr(transcript_result, "job_id"):
             # Fallback: just string-ify whatever Supadata returned
-            status = "completed"
-            raw_text = str(transcript_result)
+            return str(transcript_result), "completed", None
+
+        job_id = transcript_result.job_id
+        print(f"Supadata returned job_id={job_id}, polling for completion...")
+    else:
+        print(f"Resuming Supadata job_id={job_id}...")
+
+    _pending_supadata_jobs[key] = job_id
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + deadline_s
+    delay = SUPADATA_POLL_INITIAL_S
+    status = "unknown"
+
+    while True:
+        try:
+            job = await asyncio.to_thread(supadata.transcript.get_job_status, job_id)
+        except Exception as e:
+            print(f"Error while polling Supadata job {job_id}:\n{traceback.format_exc()}")
+            # Unknown, expired or unreachable: don't let later requests resume it
+            _pending_supadata_jobs.pop(key, None)
+            raise HTTPException(
+                status_code=502,
+                detail=f"Transcript service error: {str(e)}",
+            )
 
+        status = getattr(job, "status", "unknown")
+        print(f"[Supadata job poll] job_id={job_id} status={status}")
+
+        if status == "completed":
+            _pending_supadata_jobs.pop(key, None)
+            return getattr(job, "content", "") or "", status, job_id
+        if status in ("failed", "error"):
+            _pending_supadata_jobs.pop(key, None)
+            raise HTTPException(
+                status_code=500,
+                detail=f"Transcript job failed with status: {status}",
+            )
+
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            raise TranscriptPending(job_id, status)
+
+        # Adaptive backoff: poll quickly at first, then back off
+        await asyncio.sleep(min(delay, remaining))
+        delay = min(delay * 1.5, SUPADATA_POLL_MAX_S)
+
+
+# --- ingest pipeline after the transcript is available ---
+def ingest_supadata_transcript(
+    raw_text: str,
+    status: str,
+    video_id: str,
+    chosen_lang: str,
+    chunk_size: Optional[int] = DEFAULT_CHUNK_SIZE,
+    overlap: Optional[int] = DEFAULT_CHUNK_OVERLAP,
+    collection_name: str = DEFAULT_COLLECTION_NAME,
+    persist_dir: str = DEFAULT_PERSIST_DIR,
+    reset_collection: bool = False,
+    progress: Optional[Callable[[str, int], None]] = None,
+    cached_paragraphs: Optional[List[str]] = None,
+    session_id: str = DEFAULT_SESSION_ID,
+) -> dict:
+    """
+    Clean a Supadata transcript into paragraphs, create overlapping chunks,
+    generate embeddings, and store them into ChromaDB.
+
+    cached_paragraphs, when given, come from the transcript cache and skip cleaning.
+    A video already stored with the same transcript and chunk parameters is
+    skipped unless reset_collection is set.
+    Chunks go to the session's own copy of collection_name.
+    """
+    progress = progress or ignore_progress
+    from_cache = cached_paragraphs is not None
+    try:
+        collection_name = session_collection_name(collection_name, session_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if from_cache:
+        paragraphs = cached_paragraphs
+    else:
         if not raw_text.strip():
             raise HTTPException(
                 status_code=500,
@@ -173,6 +225,7 @@ def yt_url_chunks_inmemory(
             )
 
         # ---- CLEAN TEXT ----
+        progress("cleaning", 0)
         # join spaces & tidy punctuation
         clean_text = re.sub(r"\s+", " ", raw_text).strip()
         clean_text = re.sub(r" ([.,!?])", r"\1", clean_text)
@@ -184,75 +237,226 @@ def yt_url_chunks_inmemory(
             if p.strip()
         ]
 
-        if not paragraphs:
-            raise HTTPException(status_code=500, detail="No paragraphs generated from transcript")
+        if paragraphs:
+            put_transcript(video_id, chosen_lang, SUPADATA_CAPTION_TYPE, raw_text, paragraphs)
+
+    if not paragraphs:
+        raise HTTPException(status_code=500, detail="No paragraphs generated from transcript")
+
+    print(f"Generated {len(paragraphs)} paragraphs from transcript")
+
+    # We don't get manual/auto flags from Supadata like youtube_transcript_api,
+    # so we mark them as 'unknown' / based on chosen_lang.
+    caption_type = "unknown"
+    lang_code = chosen_lang
+    lang_label = chosen_lang
+
+    response_data = {
+        "status": "ok",
+        "video_id": video_id,
+        "caption_type": caption_type,
+        "language": lang_code,
+        "language_label": lang_label,
+        "paragraphs_count": len(paragraphs),
+        "session_id": session_id,
+        "collection_name": collection_name,
+        "persist_dir": persist_dir,
+        "reset_collection": reset_collection,
+        "supadata_job_status": status,
+        "from_cache": from_cache,
+    }
+
+    # ---- SKIP VIDEOS ALREADY STORED WITH THE SAME TRANSCRIPT + CHUNK PARAMS ----
+    fingerprint = chunk_fingerprint(paragraphs, chunk_size, overlap)
+    existing = current_video_chunks(
+        video_id, fingerprint, count_chunks(paragraphs, chunk_size, overlap),
+        collection_name, persist_dir, reset_collection,
+    )
+    if existing:
+        print(f"video_id={video_id} already ingested ({existing} chunks); skipping")
+        progress("completed", existing)
+        return {**response_data, "chunks_created": existing, "skipped": True}
+
+    # ---- CREATE CHUNKS, EMBED & STORE (streamed) ----
+    print(f"Creating chunks and embeddings for video_id={video_id}...")
+    progress("embedding", 0)
+
+    try:
+        # Chunks are embedded in batches and flushed to ChromaDB as they arrive
+        chunk_stream = iter_embedded_chunks(
+            paragraphs,
+            chunk_size_words=chunk_size,
+            overlap_words=overlap,
+            filename=f"{video_id}.txt",
+            video_id=video_id,
+            fingerprint=fingerprint,
+        )
+        # Replaces the video's earlier chunks only once the new ones are stored
+        chunks_created = replace_video_chunks(
+            iter_with_progress(chunk_stream, lambda n: progress("embedding", n)),
+            {video_id: fingerprint},
+            collection_name=collection_name,
+            persist_dir=persist_dir,
+            reset_collection=reset_collection,
+        ).get(video_id, 0)
+    except Exception as e:
+        print(f"Error creating / storing chunk embeddings:\n{traceback.format_exc()}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Chunk embedding/storage failed: {str(e)}",
+        )
+
+    if not chunks_created:
+        raise HTTPException(
+            status_code=500,
+            detail="No chunks/embeddings generated from transcript",
+        )
+
+    print(
+        f"Stored {chunks_created} chunks in ChromaDB collection "
+        f"'{collection_name}' at '{persist_dir}'"
+    )
+
+    # ---- BUILD RESPONSE ----
+    progress("completed", chunks_created)
+    return {**response_data, "chunks_created": chunks_created, "skipped": False}
+
+
+# --- ingest pipeline (shared by the endpoint and background jobs) ---
+def ingest_supadata_video(
+    url: str,
+    langs: Optional[str] = "hi,en",
+    chunk_size: Optional[int] = DEFAULT_CHUNK_SIZE,
+    overlap: Optional[int] = DEFAULT_CHUNK_OVERLAP,
+    collection_name: str = DEFAULT_COLLECTION_NAME,
+    persist_dir: str = DEFAULT_PERSIST_DIR,
+    reset_collection: bool = False,
+    progress: Optional[Callable[[str, int], None]] = None,
+    session_id: str = DEFAULT_SESSION_ID,
+) -> dict:
+    """
+    Fetch YouTube transcript via Supadata,
+    clean it into paragraphs, create overlapping chunks,
+    generate embeddings, and store them into ChromaDB.
+
+    Blocking variant for worker threads (background jobs).
+    progress, if given, is called as progress(stage, chunks_embedded).
+    Errors are raised as HTTPException so callers can surface status codes.
+    """
+    progress = progress or ignore_progress
 
-        print(f"Generated {len(paragraphs)} paragraphs from transcript")
+    # A fresh collection starts a fresh chat history
+    if reset_collection:
+        delete_all_records(session_id)
 
-        # ---- CREATE CHUNKS & EMBEDDINGS ----
-        print(f"Creating chunks and embeddings for video_id={video_id}...")
+    try:
+        video_id, chosen_lang = _prepare_ingest(url, langs)
 
-        try:
-            chunk_data = create_chunks_from_paragraphs(
-                paragraphs=paragraphs,
-                chunk_size_words=chunk_size,
-                overlap_words=overlap,
-                filename=f"{video_id}.txt",
-                video_id=video_id,
-            )
-        except Exception as e:
-            print(f"Error creating chunks / embeddings:\n{traceback.format_exc()}")
-            raise HTTPException(
-                status_code=500,
-                detail=f"Chunk/embedding creation failed: {str(e)}",
-            )
+        # ---- FETCH TRANSCRIPT (cache first, then Supadata) ----
+        progress("fetching_transcript", 0)
+        cached = get_transcript(video_id, chosen_lang, SUPADATA_CAPTION_TYPE)
+        if cached:
+            raw_text, status = cached["raw_text"], "cached"
+        else:
+            try:
+                raw_text, status, _ = asyncio.run(fetch_supadata_transcript(url, chosen_lang))
+            except TranscriptPending as e:
+                # The job stays registered, so retrying this ingest resumes it
+                raise HTTPException(
+                    status_code=504,
+                    detail=f"Transcript job {e.job_id} did not complete in time (last status: {e.status})",
+                )
 
-        if not chunk_data:
-            raise HTTPException(
-                status_code=500,
-                detail="No chunks/embeddings generated from transcript",
-            )
+        return ingest_supadata_transcript(
+            raw_text,
+            status,
+            video_id,
+            chosen_lang,
+            chunk_size=chunk_size,
+            overlap=overlap,
+            collection_name=collection_name,
+            persist_dir=persist_dir,
+            reset_collection=reset_collection,
+            progress=progress,
+            cached_paragraphs=cached["paragraphs"] if cached else None,
+            session_id=session_id,
+        )
 
-        # ---- STORE IN CHROMA ----
-        try:
-            collection = store_embeddings_in_chroma(
-                all_data=chunk_data,
-                collection_name=collection_name,
-                persist_dir=persist_dir,
-                reset_collection=reset_collection,
-            )
-            print(
-                f"Stored {len(chunk_data)} chunks in ChromaDB collection "
-                f"'{collection_name}' at '{persist_dir}'"
-            )
-        except Exception as e:
-            print(f"Failed to store embeddings to ChromaDB:\n{traceback.format_exc()}")
-            raise HTTPException(
-                status_code=500,
-                detail=f"Failed to persist embeddings to ChromaDB: {str(e)}",
-            )
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Unexpected error in endpoint:\n{traceback.format_exc()}")
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
-        # ---- BUILD RESPONSE ----
-        # We don't get manual/auto flags from Supadata like youtube_transcript_api,
-        # so we mark them as 'unknown' / based on chosen_lang.
-        caption_type = "unknown"
-        lang_code = chosen_lang
-        lang_label = chosen_lang
-
-        response_data = {
-            "status": "ok",
-            "video_id": video_id,
-            "caption_type": caption_type,
-            "language": lang_code,
-            "language_label": lang_label,
-            "paragraphs_count": len(paragraphs),
-            "chunks_created": len(chunk_data),
-            "collection_name": collection_name,
-            "persist_dir": persist_dir,
-            "reset_collection": reset_collection,
-            "supadata_job_status": status,
-        }
 
+# --- main endpoint ---
+@router.get(
+    "/yt_url_chunks_inmemory",
+    summary="My Application Old new ",
+)
+async def yt_url_chunks_inmemory(
+    url: str = Query(..., description="YouTube URL or video id"),
+    langs: Optional[str] = Query("hi,en", description="Comma-separated preferred languages"),
+    chunk_size: Optional[int] = Query(DEFAULT_CHUNK_SIZE, description="Words per chunk"),
+    overlap: Optional[int] = Query(DEFAULT_CHUNK_OVERLAP, description="Overlapping words between chunks"),
+    collection_name: str = Query(DEFAULT_COLLECTION_NAME, pattern=COLLECTION_NAME_PATTERN, description="ChromaDB collection name"),
+    persist_dir: str = Query(DEFAULT_PERSIST_DIR, description="ChromaDB persistence directory"),
+    reset_collection: bool = Query(False, description="Reset the ChromaDB collection before inserting"),
+    supadata_job_id: Optional[str] = Query(None, description="Resume a pending Supadata transcript job"),
+    session_id: str = Query(DEFAULT_SESSION_ID, pattern=SESSION_ID_PATTERN, description="Chat session id"),
+):
+    """
+    Fetch YouTube transcript via Supadata,
+    clean it into paragraphs, create overlapping chunks,
+    generate embeddings, and store them into ChromaDB.
+
+    If the Supadata job is still running at the polling deadline, a 202 with
+    the job id is returned; call again (same url, or with supadata_job_id)
+    to resume it.
+    """
+    # A fresh collection starts a fresh chat history
+    if reset_collection:
+        await run_in_threadpool(delete_all_records, session_id)
+
+    try:
+        video_id, chosen_lang = _prepare_ingest(url, langs)
+
+        # ---- FETCH TRANSCRIPT (cache first, then Supadata polled on the event loop) ----
+        cached = None
+        if not supadata_job_id:
+            cached = await run_in_threadpool(get_transcript, video_id, chosen_lang, SUPADATA_CAPTION_TYPE)
+
+        if cached:
+            raw_text, status = cached["raw_text"], "cached"
+        else:
+            try:
+                raw_text, status, _ = await fetch_supadata_transcript(url, chosen_lang, job_id=supadata_job_id)
+            except TranscriptPending as e:
+                return JSONResponse(
+                    status_code=202,
+                    content={
+                        "status": "pending",
+                        "video_id": video_id,
+                        "supadata_job_id": e.job_id,
+                        "supadata_job_status": e.status,
+                        "message": "Transcript is still being generated; call again to resume.",
+                    },
+                )
+
+        response_data = await run_in_threadpool(
+            ingest_supadata_transcript,
+            raw_text,
+            status,
+            video_id,
+            chosen_lang,
+            chunk_size=chunk_size,
+            overlap=overlap,
+            collection_name=collection_name,
+            persist_dir=persist_dir,
+            reset_collection=reset_collection,
+            cached_paragraphs=cached["paragraphs"] if cached else None,
+            session_id=session_id,
+        )
         return JSONResponse(response_data)
 
     except HTTPException:
@@ -260,4 +464,3 @@ def yt_url_chunks_inmemory(
     except Exception as e:
         print(f"Unexpected error in endpoint:\n{traceback.format_exc()}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
-
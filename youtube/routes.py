@@ -2,53 +2,68 @@
 routes.py - API endpoints
 """
 from fastapi import APIRouter, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import JSONResponse
-from pathlib import Path
-from typing import Optional
+from typing import Optional, Callable
 import traceback
 from chat_db.databse import delete_all_records
-from youtube.file_utils import clear_out_dir
 from youtube.youtube_service import fetch_youtube_transcript
-from youtube.vtt_processor import clean_vtt_to_paragraphs
+from youtube.vtt_processor import clean_caption_text_to_paragraphs
 from youtube.config import (
-    OUT_DIR,
     DEFAULT_CHUNK_SIZE,
     DEFAULT_CHUNK_OVERLAP,
     DEFAULT_COLLECTION_NAME,
     DEFAULT_PERSIST_DIR,
+    DEFAULT_SESSION_ID,
+    SESSION_ID_PATTERN,
+    COLLECTION_NAME_PATTERN,
 )
 
-from embedding.chunk_utils import create_chunks_from_paragraphs
-from chroma.chroma_store import store_embeddings_in_chroma
+from embedding.chunk_utils import (
+    iter_embedded_chunks,
+    iter_with_progress,
+    ignore_progress,
+    chunk_fingerprint,
+    count_chunks,
+)
+from chroma.chroma_store import current_video_chunks, replace_video_chunks, session_collection_name
 
 transcript_router = APIRouter()
 
 
-@transcript_router.get(
-    "/yt_url_chunks_inmemory",
-    summary="Download, clean, chunk and store embeddings in ChromaDB"
-)
-def yt_url_chunks_inmemory(
-    url: str = Query(..., description="YouTube URL or video id"),
-    langs: Optional[str] = Query("hi,en", description="Comma-separated preferred languages"),
-    chunk_size: Optional[int] = Query(DEFAULT_CHUNK_SIZE, description="Words per chunk"),
-    overlap: Optional[int] = Query(DEFAULT_CHUNK_OVERLAP, description="Overlapping words between chunks"),
-    collection_name: str = Query(DEFAULT_COLLECTION_NAME, description="ChromaDB collection name"),
-    persist_dir: str = Query(DEFAULT_PERSIST_DIR, description="ChromaDB persistence directory"),
-    reset_collection: bool = Query(True, description="Reset the ChromaDB collection before inserting"),
-):
+def ingest_youtube_video(
+    url: str,
+    langs: Optional[str] = "hi,en",
+    chunk_size: Optional[int] = DEFAULT_CHUNK_SIZE,
+    overlap: Optional[int] = DEFAULT_CHUNK_OVERLAP,
+    collection_name: str = DEFAULT_COLLECTION_NAME,
+    persist_dir: str = DEFAULT_PERSIST_DIR,
+    reset_collection: bool = False,
+    progress: Optional[Callable[[str, int], None]] = None,
+    session_id: str = DEFAULT_SESSION_ID,
+) -> dict:
     """
     Fetch YouTube captions, clean them into paragraphs, create overlapping chunks,
     generate Gemini embeddings, and store them into ChromaDB.
-    """
 
-    delete_all_records()
+    Ingest is incremental: a video already stored with the same transcript and
+    chunk parameters is skipped; otherwise its chunks are upserted. Only
+    reset_collection wipes the collection (and the chat history). Both are
+    those of session_id: chunks go to the session's own copy of collection_name.
 
+    progress, if given, is called as progress(stage, chunks_embedded).
+    Errors are raised as HTTPException so callers can surface status codes.
+    """
+    progress = progress or ignore_progress
     try:
-        # Clean temp directory
-        print("Cleaning output directory...")
-        clear_out_dir()
+        collection_name = session_collection_name(collection_name, session_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
+    if reset_collection:
+        delete_all_records(session_id)
+
+    try:
         # Parse preferred languages
         preferred = [l.strip() for l in langs.split(",") if l.strip()]
         if not preferred:
@@ -62,6 +77,7 @@ def yt_url_chunks_inmemory(
 
         # Fetch captions
         print("Fetching captions...")
+        progress("fetching_transcript", 0)
         try:
             res = fetch_youtube_transcript(url, preferred_langs=preferred)
         except RuntimeError as e:
@@ -83,88 +99,131 @@ def yt_url_chunks_inmemory(
 
         print(f"Caption type: {res.get('type')}, Language: {res.get('lang')}")
 
-        # Get VTT file path
-        file_path = Path(res["file"])
-        vtt_candidate = None
-
-        if str(file_path).lower().endswith(".vtt"):
-            vtt_candidate = str(file_path)
-            print(f"Using VTT file: {vtt_candidate}")
-        else:
-            sibling = file_path.with_suffix('.vtt')
-            if sibling.exists():
-                vtt_candidate = str(sibling)
-                print(f"Using sibling VTT file: {vtt_candidate}")
-
-        if not vtt_candidate:
-            # Fallback: write provided plain text into a temporary vtt file
-            print("Creating temporary VTT file from text...")
-            tmp_vtt = OUT_DIR / "tmp_for_cleaning.vtt"
-            tmp_vtt.write_text(res.get("text", ""), encoding="utf-8")
-            vtt_candidate = str(tmp_vtt)
-
-        # Produce cleaned paragraphs
-        print("Cleaning captions into paragraphs...")
-        try:
-            paragraphs = clean_vtt_to_paragraphs(vtt_candidate)
-        except FileNotFoundError as e:
-            raise HTTPException(status_code=500, detail=str(e))
-        except Exception as e:
-            print(f"Error cleaning captions: {traceback.format_exc()}")
-            raise HTTPException(status_code=500, detail=f"Failed to clean captions: {str(e)}")
+        # Cleaned paragraphs come with the transcript (cached or freshly downloaded)
+        paragraphs = res.get("paragraphs")
+        paragraph_starts = res.get("paragraph_starts")
+        if res.get("from_cache"):
+            print("Transcript served from cache")
+
+        if not paragraphs:
+            # Produce cleaned paragraphs from the in-memory caption text
+            print("Cleaning captions into paragraphs...")
+            progress("cleaning", 0)
+            try:
+                res["dedup"] = {}
+                timed = clean_caption_text_to_paragraphs(
+                    res.get("raw_caption") or res.get("text", ""),
+                    res.get("caption_format", "vtt"),
+                    stats=res["dedup"],
+                )
+                paragraphs = [p for _, p in timed]
+                paragraph_starts = [start for start, _ in timed]
+            except Exception as e:
+                print(f"Error cleaning captions: {traceback.format_exc()}")
+                raise HTTPException(status_code=500, detail=f"Failed to clean captions: {str(e)}")
 
         if not paragraphs:
             raise HTTPException(status_code=500, detail="No paragraphs generated from captions")
 
-        # Create chunks + embeddings using chunk_utils
         video_id = res.get("id", "video")
+        response_data = {
+            "status": "ok",
+            "video_id": video_id,
+            "caption_type": res.get("type"),
+            "caption_format": res.get("caption_format"),
+            "language": res.get("lang"),
+            "paragraphs_count": len(paragraphs),
+            "session_id": session_id,
+            "collection_name": collection_name,
+            "persist_dir": persist_dir,
+            "reset_collection": reset_collection,
+            "from_cache": bool(res.get("from_cache")),
+            "caption_dedup": res.get("dedup"),
+        }
+
+        # Skip videos already stored with this transcript and these chunk parameters
+        fingerprint = chunk_fingerprint(paragraphs, chunk_size, overlap)
+        existing = current_video_chunks(
+            video_id, fingerprint, count_chunks(paragraphs, chunk_size, overlap),
+            collection_name, persist_dir, reset_collection,
+        )
+        if existing:
+            print(f"video_id={video_id} already ingested ({existing} chunks); skipping")
+            progress("completed", existing)
+            return {**response_data, "chunks_created": existing, "skipped": True}
+
+        # Create chunks + embeddings and store them in ChromaDB as a stream
         print(f"Creating chunks and embeddings for video_id={video_id}...")
+        progress("embedding", 0)
 
         try:
-            chunk_data = create_chunks_from_paragraphs(
-                paragraphs=paragraphs,
+            # Chunks are embedded in batches and flushed to ChromaDB as they arrive
+            chunk_stream = iter_embedded_chunks(
+                paragraphs,
                 chunk_size_words=chunk_size,
                 overlap_words=overlap,
                 filename=f"{video_id}.txt",
                 video_id=video_id,
+                paragraph_starts=paragraph_starts,
+                fingerprint=fingerprint,
             )
-        except Exception as e:
-            print(f"Error creating chunks / embeddings: {traceback.format_exc()}")
-            raise HTTPException(status_code=500, detail=f"Chunk/embedding creation failed: {str(e)}")
-
-        if not chunk_data:
-            raise HTTPException(status_code=500, detail="No chunks/embeddings generated from captions")
-
-        # Store in ChromaDB
-        try:
-            collection = store_embeddings_in_chroma(
-                all_data=chunk_data,
+            # Replaces the video's earlier chunks only once the new ones are stored
+            chunks_created = replace_video_chunks(
+                iter_with_progress(chunk_stream, lambda n: progress("embedding", n)),
+                {video_id: fingerprint},
                 collection_name=collection_name,
                 persist_dir=persist_dir,
                 reset_collection=reset_collection,
-            )
-            print(f"Stored {len(chunk_data)} chunks in ChromaDB collection '{collection_name}' at '{persist_dir}'")
+            ).get(video_id, 0)
         except Exception as e:
-            print(f"Failed to store embeddings to ChromaDB: {traceback.format_exc()}")
-            raise HTTPException(status_code=500, detail=f"Failed to persist embeddings to ChromaDB: {str(e)}")
+            print(f"Error creating / storing chunk embeddings: {traceback.format_exc()}")
+            raise HTTPException(status_code=500, detail=f"Chunk embedding/storage failed: {str(e)}")
 
-        # Return summary instead of file
-        response_data = {
-            "status": "ok",
-            "video_id": video_id,
-            "caption_type": res.get("type"),
-            "language": res.get("lang"),
-            "paragraphs_count": len(paragraphs),
-            "chunks_created": len(chunk_data),
-            "collection_name": collection_name,
-            "persist_dir": persist_dir,
-            "reset_collection": reset_collection,
-        }
+        if not chunks_created:
+            raise HTTPException(status_code=500, detail="No chunks/embeddings generated from captions")
+
+        print(f"Stored {chunks_created} chunks in ChromaDB collection '{collection_name}' at '{persist_dir}'")
 
-        return JSONResponse(response_data)
+        progress("completed", chunks_created)
+        # Return summary instead of file
+        return {**response_data, "chunks_created": chunks_created, "skipped": False}
 
     except HTTPException:
         raise
     except Exception as e:
         print(f"Unexpected error in endpoint: {traceback.format_exc()}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+
+@transcript_router.get(
+    "/yt_url_chunks_inmemory",
+    summary="Download, clean, chunk and store embeddings in ChromaDB"
+)
+async def yt_url_chunks_inmemory(
+    url: str = Query(..., description="YouTube URL or video id"),
+    langs: Optional[str] = Query("hi,en", description="Comma-separated preferred languages"),
+    chunk_size: Optional[int] = Query(DEFAULT_CHUNK_SIZE, description="Words per chunk"),
+    overlap: Optional[int] = Query(DEFAULT_CHUNK_OVERLAP, description="Overlapping words between chunks"),
+    collection_name: str = Query(DEFAULT_COLLECTION_NAME, pattern=COLLECTION_NAME_PATTERN, description="ChromaDB collection name"),
+    persist_dir: str = Query(DEFAULT_PERSIST_DIR, description="ChromaDB persistence directory"),
+    reset_collection: bool = Query(False, description="Reset the ChromaDB collection before inserting"),
+    session_id: str = Query(DEFAULT_SESSION_ID, pattern=SESSION_ID_PATTERN, description="Chat session id"),
+):
+    """
+    Fetch YouTube captions, clean them into paragraphs, create overlapping chunks,
+    generate Gemini embeddings, and store them into ChromaDB.
+
+    The blocking pipeline runs in the threadpool, off the event loop.
+    """
+    response_data = await run_in_threadpool(
+        ingest_youtube_video,
+        url=url,
+        langs=langs,
+        chunk_size=chunk_size,
+        overlap=overlap,
+        collection_name=collection_name,
+        persist_dir=persist_dir,
+        reset_collection=reset_collection,
+        session_id=session_id,
+    )
+    return JSONResponse(response_data)
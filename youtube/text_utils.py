@@ -0,0 +1,26 @@
+"""
+text_utils.py - Word-level text helpers shared by caption cleaning and retrieval
+"""
+from typing import List
+
+
+def overlap_words(prev: List[str], new: List[str]) -> int:
+    """
+    Length of the longest suffix of prev that is also a prefix of new.
+
+    KMP prefix function over new + sentinel + prev, so linear in line length.
+    """
+    n = min(len(prev), len(new))
+    if n == 0:
+        return 0
+
+    seq = new[:n] + [None] + prev[-n:]
+    pi = [0] * len(seq)
+    for i in range(1, len(seq)):
+        k = pi[i - 1]
+        while k and seq[i] != seq[k]:
+            k = pi[k - 1]
+        if seq[i] == seq[k]:
+            k += 1
+        pi[i] = k
+    return pi[-1]
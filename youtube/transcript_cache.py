@@ -0,0 +1,137 @@
+"""
+transcript_cache.py - Persistent transcript cache keyed by (video_id, lang, caption_type)
+
+Stores the raw caption/transcript text, its format and the cleaned paragraphs
+(with their start times when known) in a local SQLite file. Entries expire after TRANSCRIPT_CACHE_TTL_S and the least recently
+used ones are evicted once the stored text exceeds TRANSCRIPT_CACHE_MAX_BYTES.
+"""
+import json
+import sqlite3
+import threading
+import time
+from typing import List, Optional
+
+from youtube.config import (
+    TRANSCRIPT_CACHE_PATH,
+    TRANSCRIPT_CACHE_TTL_S,
+    TRANSCRIPT_CACHE_MAX_BYTES,
+)
+
+_lock = threading.Lock()
+_conn = None
+
+
+def _get_conn() -> sqlite3.Connection:
+    """Open the cache database once per process and create the table."""
+    global _conn
+    if _conn is None:
+        _conn = sqlite3.connect(TRANSCRIPT_CACHE_PATH, check_same_thread=False)
+        _conn.execute("PRAGMA journal_mode=WAL")
+        _conn.execute('''
+            CREATE TABLE IF NOT EXISTS transcripts (
+                video_id TEXT NOT NULL,
+                lang TEXT NOT NULL,
+                caption_type TEXT NOT NULL,
+                raw_text TEXT NOT NULL,
+                paragraphs TEXT NOT NULL,
+                paragraph_starts TEXT,
+                caption_format TEXT NOT NULL DEFAULT 'vtt',
+                size_bytes INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (video_id, lang, caption_type)
+            )
+        ''')
+        # Caches created before paragraph start times were stored
+        columns = {row[1] for row in _conn.execute("PRAGMA table_info(transcripts)")}
+        if "paragraph_starts" not in columns:
+            _conn.execute("ALTER TABLE transcripts ADD COLUMN paragraph_starts TEXT")
+        if "caption_format" not in columns:
+            _conn.execute("ALTER TABLE transcripts ADD COLUMN caption_format TEXT NOT NULL DEFAULT 'vtt'")
+        _conn.execute("CREATE INDEX IF NOT EXISTS idx_transcripts_last_used ON transcripts(last_used)")
+        _conn.commit()
+    return _conn
+
+
+def get_transcript(video_id: str, lang: str, caption_type: str) -> Optional[dict]:
+    """
+    Return {"raw_text", "caption_format", "paragraphs", "paragraph_starts", "created_at"}
+    for a fresh entry, else None. paragraph_starts is None when start times are unknown.
+    """
+    now = time.time()
+    with _lock:
+        conn = _get_conn()
+        row = conn.execute('''
+            SELECT raw_text, paragraphs, created_at, paragraph_starts, caption_format FROM transcripts
+            WHERE video_id = ? AND lang = ? AND caption_type = ?
+        ''', (video_id, lang, caption_type)).fetchone()
+
+        if row is None:
+            return None
+
+        if now - row[2] > TRANSCRIPT_CACHE_TTL_S:
+            conn.execute(
+                "DELETE FROM transcripts WHERE video_id = ? AND lang = ? AND caption_type = ?",
+                (video_id, lang, caption_type),
+            )
+            conn.commit()
+            return None
+
+        conn.execute(
+            "UPDATE transcripts SET last_used = ? WHERE video_id = ? AND lang = ? AND caption_type = ?",
+            (now, video_id, lang, caption_type),
+        )
+        conn.commit()
+
+    print(f"Transcript cache hit: video_id={video_id}, lang={lang}, type={caption_type}")
+    return {
+        "raw_text": row[0],
+        "caption_format": row[4],
+        "paragraphs": json.loads(row[1]),
+        "paragraph_starts": json.loads(row[3]) if row[3] else None,
+        "created_at": row[2],
+    }
+
+
+def put_transcript(
+    video_id: str,
+    lang: str,
+    caption_type: str,
+    raw_text: str,
+    paragraphs: List[str],
+    paragraph_starts: Optional[List[Optional[float]]] = None,
+    caption_format: str = "vtt",
+) -> None:
+    """Store a transcript, then drop expired entries and LRU entries over the size cap."""
+    paragraphs_json = json.dumps(paragraphs, ensure_ascii=False)
+    starts_json = json.dumps(paragraph_starts) if paragraph_starts is not None else None
+    size_bytes = len(raw_text.encode("utf-8")) + len(paragraphs_json.encode("utf-8"))
+    now = time.time()
+
+    with _lock:
+        conn = _get_conn()
+        conn.execute('''
+            INSERT OR REPLACE INTO transcripts
+                (video_id, lang, caption_type, raw_text, paragraphs, paragraph_starts,
+                 caption_format, size_bytes, created_at, last_used)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (video_id, lang, caption_type, raw_text, paragraphs_json, starts_json,
+              caption_format, size_bytes, now, now))
+
+        conn.execute("DELETE FROM transcripts WHERE created_at < ?", (now - TRANSCRIPT_CACHE_TTL_S,))
+
+        total = conn.execute("SELECT COALESCE(SUM(size_bytes), 0) FROM transcripts").fetchone()[0]
+        if total > TRANSCRIPT_CACHE_MAX_BYTES:
+            rows = conn.execute(
+                "SELECT video_id, lang, caption_type, size_bytes FROM transcripts ORDER BY last_used"
+            ).fetchall()
+            for vid, lg, ctype, size in rows:
+                if total <= TRANSCRIPT_CACHE_MAX_BYTES:
+                    break
+                conn.execute(
+                    "DELETE FROM transcripts WHERE video_id = ? AND lang = ? AND caption_type = ?",
+                    (vid, lg, ctype),
+                )
+                total -= size
+
+        conn.commit()
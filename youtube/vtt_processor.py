@@ -1,128 +1,362 @@
 """
-vtt_processor.py - VTT file processing and cleaning
+vtt_processor.py - VTT / json3 caption processing and cleaning
+
+All caption text goes through one single-pass, line-streaming parser:
+
+    iter_caption_lines  ->  iter_deduplicated_lines  ->  iter_sentences  ->  iter_paragraphs
+
+vtt_to_plaintext and clean_vtt_to_paragraphs are thin views over it, so a
+caption is parsed once and memory stays flat on very long captions.
+
+YouTube's json3 format enters the same pipeline through iter_json3_caption_lines:
+its events are already structured and never roll, so no regex scrubbing or
+de-dup is needed. VTT stays the fallback format.
 """
+import io
+import json
 from pathlib import Path
 import re
-from typing import List
-from youtube.config import MAX_PARA_CHARS, MAX_LINES_WITHOUT_PUNCT
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from youtube.config import MAX_PARA_CHARS, MAX_LINES_WITHOUT_PUNCT, DEDUP_MIN_OVERLAP_WORDS
+from youtube.text_utils import overlap_words
 
+# Compiled once; every pattern is applied to a single line
+_TIMESTAMP = r'(\d{1,2}):(\d{2})(?::(\d{2}))?[\.,]?(\d{0,3})'
+_CUE_TIMING_RE = re.compile(_TIMESTAMP + r'\s*-->\s*' + _TIMESTAMP)
+_INLINE_TIMESTAMP_RE = re.compile(r'<\d{1,2}:\d{2}(?::\d{2})?[\.,]?\d{0,3}>')
+_TAG_RE = re.compile(r'</?[^>]+>')
+_CUE_SETTING_RE = re.compile(r'align:\w+\s*|position:\d+%')
+_WHITESPACE_RE = re.compile(r'\s+')
+_DIGITS_RE = re.compile(r'\d+')
+_SENTENCE_END_RE = re.compile(r'[।\.\?\!]\s*$')
+_SPACE_BEFORE_PUNCT_RE = re.compile(r'\s+([।\.\?\!,;:])')
 
-def vtt_to_plaintext(path: str) -> str:
-    """Convert VTT file to plain text."""
-    p = Path(path)
-    if not p.exists():
-        raise FileNotFoundError(f"VTT file not found: {path}")
-    
-    try:
-        txt = p.read_text(encoding="utf-8", errors="ignore")
-    except Exception as e:
-        raise RuntimeError(f"Failed to read VTT file {path}: {e}")
-    
-    txt = re.sub(r'^\ufeff', '', txt)
-    txt = re.sub(r'^\s*WEBVTT.*\n', '', txt, flags=re.IGNORECASE)
-    lines = []
-    
-    for line in txt.splitlines():
+# A caption line with the start time (seconds) of the cue it belongs to
+CaptionLine = Tuple[Optional[float], str]
+
+
+def _timing_to_seconds(h_or_m: str, m_or_s: str, s: Optional[str], ms: str) -> float:
+    """Convert a matched cue timestamp (hh:mm:ss.mmm or mm:ss.mmm) to seconds."""
+    if s is None:
+        hours, minutes, seconds = 0, int(h_or_m), int(m_or_s)
+    else:
+        hours, minutes, seconds = int(h_or_m), int(m_or_s), int(s)
+    millis = int(ms.ljust(3, "0")) if ms else 0
+    return hours * 3600 + minutes * 60 + seconds + millis / 1000
+
+
+def iter_caption_lines(lines: Iterable[str]) -> Iterator[CaptionLine]:
+    """
+    Yield (cue_start_seconds, text) for every caption text line of a VTT stream.
+
+    Skips the WEBVTT header block, NOTE/STYLE/REGION blocks, cue identifiers
+    and timing lines; strips inline timestamps, tags and cue settings and
+    normalizes whitespace.
+    """
+    in_header = False
+    in_block = False
+    cue_start = None
+
+    for i, line in enumerate(lines):
         s = line.strip()
-        if re.fullmatch(r'\d+', s):
+        if i == 0:
+            s = s.lstrip('﻿')
+            if s.upper().startswith("WEBVTT"):
+                in_header = True
+                continue
+
+        if not s:
+            # Header and NOTE/STYLE/REGION blocks end at the first blank line
+            in_header = False
+            in_block = False
             continue
-        if re.match(r'^\d{1,2}:\d{2}(?::\d{2})?[\.,]?\d{0,3}\s*-->\s*\d{1,2}:\d{2}(?::\d{2})?[\.,]?\d{0,3}', s):
+        if in_header or in_block:
             continue
         if s.upper().startswith("NOTE") or s.startswith("STYLE") or s.startswith("REGION"):
+            in_block = True
             continue
-        s = re.sub(r'<\d{1,2}:\d{2}(?::\d{2})?[\.,]?\d{0,3}>', '', s)
-        s = re.sub(r'<\/?[^>]+>', '', s)
+
+        timing = _CUE_TIMING_RE.search(s)
+        if timing:
+            cue_start = _timing_to_seconds(*timing.groups()[:4])
+            continue
+        if _DIGITS_RE.fullmatch(s):
+            continue
+
+        s = _INLINE_TIMESTAMP_RE.sub('', s)
+        s = _TAG_RE.sub('', s)
+        s = _CUE_SETTING_RE.sub('', s)
+        s = _WHITESPACE_RE.sub(' ', s).strip()
         if s:
-            lines.append(s)
-    
-    plain = "\n".join(lines)
-    plain = re.sub(r'\n{2,}', '\n\n', plain)
-    return plain.strip()
+            yield cue_start, s
 
 
-def clean_vtt_to_paragraphs(
-    vtt_path: str,
-    max_para_chars: int = MAX_PARA_CHARS,
+def iter_json3_caption_lines(data: dict) -> Iterator[CaptionLine]:
+    """
+    Yield (line_start_seconds, text) for every caption line of a json3 document.
+
+    Each event holds word segments with offsets from the event start; a
+    newline segment starts a new line, whose start time is the offset of its
+    first word.
+    """
+    for event in data.get("events") or []:
+        segs = event.get("segs")
+        if not segs:
+            continue
+        event_start = event.get("tStartMs", 0)
+
+        words = []
+        line_start = None
+        for seg in segs:
+            for i, part in enumerate(seg.get("utf8", "").split("\n")):
+                if i:
+                    # Newline inside the segment closes the current line
+                    text = _WHITESPACE_RE.sub(' ', "".join(words)).strip()
+                    if text:
+                        yield line_start, text
+                    words = []
+                    line_start = None
+                if part.strip() and line_start is None:
+                    line_start = (event_start + seg.get("tOffsetMs", 0)) / 1000
+                words.append(part)
+
+        text = _WHITESPACE_RE.sub(' ', "".join(words)).strip()
+        if text:
+            yield line_start, text
+
+
+def iter_deduplicated_lines(
+    caption_lines: Iterable[CaptionLine],
+    min_overlap: int = DEDUP_MIN_OVERLAP_WORDS,
+    stats: Optional[Dict[str, int]] = None
+) -> Iterator[CaptionLine]:
+    """
+    Merge rolling auto-caption lines ("a b c" / "b c d" / "c d e").
+
+    Each line is compared with the previous raw line; the longest
+    suffix/prefix word overlap (at least min_overlap words, or the whole
+    line) is dropped and only the new words are yielded. If stats is given,
+    its counters are updated: words_raw counts every cue line, words_in only
+    lines that differ from the previous one (what collapsing exact repeats
+    alone would keep) and words_out what is yielded, so words_in -> words_out
+    is the saving of the overlap merge itself.
+    """
+    prev_words: List[str] = []
+    words_raw = words_in = words_out = 0
+
+    for start, ln in caption_lines:
+        words = ln.split()
+        repeat = words == prev_words
+        k = overlap_words(prev_words, words)
+        if k < min_overlap and k < len(words):
+            k = 0
+        prev_words = words
+
+        words_raw += len(words)
+        if not repeat:
+            words_in += len(words)
+        if k < len(words):
+            words_out += len(words) - k
+            yield start, " ".join(words[k:]) if k else ln
+
+        if stats is not None:
+            stats["words_raw"] = words_raw
+            stats["words_in"] = words_in
+            stats["words_out"] = words_out
+
+
+def iter_sentences(
+    caption_lines: Iterable[CaptionLine],
     max_lines_without_punct: int = MAX_LINES_WITHOUT_PUNCT
-) -> List[str]:
-    """Return a list of cleaned paragraphs from VTT file."""
-    p = Path(vtt_path)
-    if not p.exists():
-        raise FileNotFoundError(f"VTT file not found: {vtt_path}")
-    
-    try:
-        raw = p.read_text(encoding='utf-8', errors='ignore')
-    except Exception as e:
-        raise RuntimeError(f"Failed to read VTT file: {e}")
-
-    # Clean VTT formatting
-    raw = re.sub(r'^\s*WEBVTT.*\n', '', raw, flags=re.IGNORECASE | re.MULTILINE)
-    raw = re.sub(r'\d{1,2}:\d{2}(?::\d{2})?[\.,]?\d{0,3}\s*-->\s*\d{1,2}:\d{2}(?::\d{2})?[\.,]?\d{0,3}.*', '', raw)
-    raw = re.sub(r'<\d{1,2}:\d{2}(?::\d{2})?[\.,]?\d{0,3}>', '', raw)
-    raw = re.sub(r'<\/?[^>]+>', '', raw)
-    raw = re.sub(r'align:\w+\s*', '', raw)
-    raw = re.sub(r'position:\d+%','', raw)
-
-    # Process lines
-    lines = [ln.strip() for ln in raw.splitlines()]
-    lines = [ln for ln in lines if ln and not re.fullmatch(r'\d+', ln)]
-    lines = [re.sub(r'\s+', ' ', ln) for ln in lines]
-
-    # Deduplicate consecutive identical lines
-    deduped = []
-    prev = None
-    for ln in lines:
-        if ln != prev:
-            deduped.append(ln)
-        prev = ln
-
-    # Build sentences
-    sentence_end_re = re.compile(r'[।\.\?\!]\s*$')
-    sentences = []
+) -> Iterator[CaptionLine]:
+    """
+    Join de-duplicated caption lines into sentences.
+
+    A sentence ends at sentence punctuation or after max_lines_without_punct
+    lines. Yields (start_seconds, sentence).
+    """
     buf = ""
+    buf_start = None
     lines_without_punct = 0
-    
-    for ln in deduped:
+
+    for start, ln in caption_lines:
         if not buf:
             buf = ln
+            buf_start = start
         else:
             buf = buf + " " + ln
-        
-        if sentence_end_re.search(ln):
-            sentences.append(buf.strip())
+
+        if _SENTENCE_END_RE.search(ln):
+            yield buf_start, buf.strip()
             buf = ""
             lines_without_punct = 0
         else:
             lines_without_punct += 1
             if lines_without_punct >= max_lines_without_punct:
-                sentences.append(buf.strip())
+                yield buf_start, buf.strip()
                 buf = ""
                 lines_without_punct = 0
-    
+
     if buf:
-        sentences.append(buf.strip())
+        yield buf_start, buf.strip()
+
 
-    # Group sentences into paragraphs
-    paragraphs = []
+def iter_paragraphs(
+    sentences: Iterable[CaptionLine],
+    max_para_chars: int = MAX_PARA_CHARS
+) -> Iterator[CaptionLine]:
+    """Group sentences into paragraphs (~max_para_chars or 3 sentences). Yields (start_seconds, paragraph)."""
     cur_para = []
+    cur_start = None
     cur_len = 0
-    
-    for s in sentences:
+
+    def finish() -> str:
+        # Clean spacing before punctuation
+        return _SPACE_BEFORE_PUNCT_RE.sub(r'\1', " ".join(cur_para).strip())
+
+    for start, s in sentences:
+        if not cur_para:
+            cur_start = start
         cur_para.append(s)
         cur_len += len(s)
         if cur_len >= max_para_chars or len(cur_para) >= 3:
-            paragraphs.append(" ".join(cur_para).strip())
+            para = finish()
+            if para:
+                yield cur_start, para
             cur_para = []
             cur_len = 0
-    
+
     if cur_para:
-        paragraphs.append(" ".join(cur_para).strip())
-
-    # Clean spacing before punctuation
-    paragraphs = [re.sub(r'\s+([।\.\?\!,;:])', r'\1', para) for para in paragraphs]
-    
-    # Filter out empty paragraphs
-    paragraphs = [p for p in paragraphs if p and p.strip()]
-    
+        para = finish()
+        if para:
+            yield cur_start, para
+
+
+def iter_vtt_paragraphs(
+    lines: Iterable[str],
+    max_para_chars: int = MAX_PARA_CHARS,
+    max_lines_without_punct: int = MAX_LINES_WITHOUT_PUNCT,
+    stats: Optional[Dict[str, int]] = None
+) -> Iterator[CaptionLine]:
+    """Stream (start_seconds, paragraph) from VTT lines in a single pass."""
+    deduped = iter_deduplicated_lines(iter_caption_lines(lines), stats=stats)
+    return iter_paragraphs(
+        iter_sentences(deduped, max_lines_without_punct),
+        max_para_chars,
+    )
+
+
+def iter_json3_paragraphs(
+    data: dict,
+    max_para_chars: int = MAX_PARA_CHARS,
+    max_lines_without_punct: int = MAX_LINES_WITHOUT_PUNCT
+) -> Iterator[CaptionLine]:
+    """Stream (start_seconds, paragraph) from a parsed json3 document."""
+    return iter_paragraphs(
+        iter_sentences(iter_json3_caption_lines(data), max_lines_without_punct),
+        max_para_chars,
+    )
+
+
+def _report_dedup(stats: Dict[str, int]) -> None:
+    words_raw = stats.get("words_raw", 0)
+    words_in = stats.get("words_in", 0)
+    words_out = stats.get("words_out", 0)
+    if words_in:
+        print(
+            f"Rolling caption de-dup: {words_raw} raw words, {words_in} after collapsing "
+            f"repeated lines -> {words_out} words ({100 * (words_in - words_out) / words_in:.1f}% smaller)"
+        )
+
+
+def _open_vtt(path: str):
+    p = Path(path)
+    if not p.exists():
+        raise FileNotFoundError(f"VTT file not found: {path}")
+
+    try:
+        return p.open(encoding="utf-8", errors="ignore")
+    except Exception as e:
+        raise RuntimeError(f"Failed to read VTT file {path}: {e}")
+
+
+def vtt_to_plaintext(path: str) -> str:
+    """Convert VTT file to plain text."""
+    with _open_vtt(path) as f:
+        return "\n".join(ln for _, ln in iter_caption_lines(f))
+
+
+def vtt_text_to_plaintext(txt: str) -> str:
+    """Convert in-memory VTT text to plain text."""
+    return "\n".join(ln for _, ln in iter_caption_lines(io.StringIO(txt)))
+
+
+def clean_vtt_to_paragraphs(
+    vtt_path: str,
+    max_para_chars: int = MAX_PARA_CHARS,
+    max_lines_without_punct: int = MAX_LINES_WITHOUT_PUNCT,
+    stats: Optional[Dict[str, int]] = None
+) -> List[str]:
+    """Return a list of cleaned paragraphs from VTT file."""
+    stats = {} if stats is None else stats
+    with _open_vtt(vtt_path) as f:
+        paragraphs = [
+            p for _, p in iter_vtt_paragraphs(f, max_para_chars, max_lines_without_punct, stats)
+        ]
+
+    _report_dedup(stats)
+    print(f"Generated {len(paragraphs)} paragraphs")
+    return paragraphs
+
+
+def clean_vtt_text_to_paragraphs(
+    raw: str,
+    max_para_chars: int = MAX_PARA_CHARS,
+    max_lines_without_punct: int = MAX_LINES_WITHOUT_PUNCT,
+    stats: Optional[Dict[str, int]] = None
+) -> List[str]:
+    """
+    Return a list of cleaned paragraphs from in-memory VTT text.
+
+    If stats is given it receives the de-dup word counts (words_raw / words_in / words_out).
+    """
+    stats = {} if stats is None else stats
+    paragraphs = [
+        p for _, p in iter_vtt_paragraphs(io.StringIO(raw), max_para_chars, max_lines_without_punct, stats)
+    ]
+
+    _report_dedup(stats)
     print(f"Generated {len(paragraphs)} paragraphs")
-    return paragraphs
\ No newline at end of file
+    return paragraphs
+
+
+def clean_caption_text_to_paragraphs(
+    raw: str,
+    caption_format: str = "vtt",
+    max_para_chars: int = MAX_PARA_CHARS,
+    max_lines_without_punct: int = MAX_LINES_WITHOUT_PUNCT,
+    stats: Optional[Dict[str, int]] = None
+) -> List[CaptionLine]:
+    """
+    Return (start_seconds, paragraph) pairs from in-memory json3 or VTT text.
+
+    caption_format is "json3" or "vtt"; json3 that fails to parse falls back
+    to the VTT parser. Paragraph texts match clean_vtt_text_to_paragraphs.
+    """
+    stats = {} if stats is None else stats
+
+    data = None
+    if caption_format == "json3":
+        try:
+            data = json.loads(raw)
+        except ValueError as e:
+            print(f"Warning: invalid json3 captions, falling back to VTT parser: {e}")
+
+    if isinstance(data, dict):
+        timed = list(iter_json3_paragraphs(data, max_para_chars, max_lines_without_punct))
+    else:
+        timed = list(iter_vtt_paragraphs(io.StringIO(raw), max_para_chars, max_lines_without_punct, stats))
+        _report_dedup(stats)
+
+    print(f"Generated {len(timed)} paragraphs")
+    return timed
@@ -2,16 +2,44 @@
 youtube_service.py - YouTube caption download and metadata extraction
 """
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from yt_dlp import YoutubeDL
-from typing import Optional, List
+from typing import Optional, List, Tuple
+import copy
+import tempfile
 import time
 from youtube.config import (
     OUT_DIR,
     YOUTUBE_CLIENTS,
     MAX_CLIENTS_TRY,
+    YOUTUBE_CLIENT_RACE_WORKERS,
+    CAPTION_FORMATS,
     DEFAULT_LANGUAGES,
     COOKIES_FILE,      # 🔹 make sure this is defined in config.py
 )
+from youtube.transcript_cache import get_transcript, put_transcript
+from youtube.vtt_processor import clean_caption_text_to_paragraphs
+
+
+def extract_video_id(url_or_id: str) -> str:
+    """
+    Accepts full YouTube URL or plain video id and returns the video id.
+    Examples:
+      https://youtu.be/vuOx32ypfGY?si=...
+      https://www.youtube.com/watch?v=vuOx32ypfGY&ab_channel=...
+      vuOx32ypfGY
+    """
+    u = url_or_id.strip()
+
+    # already looks like an id (no slash, no 'http')
+    if "http://" not in u and "https://" not in u and "/" not in u:
+        return u
+
+    if "v=" in u:
+        return u.split("v=")[1].split("&")[0]
+
+    # youtu.be/ID?...
+    return u.split("/")[-1].split("?")[0]
 
 
 def inspect_metadata(url: str) -> dict:
@@ -37,29 +65,87 @@ def inspect_metadata(url: str) -> dict:
         "auto": auto,
         "full_info_sample": {
             k: info.get(k) for k in ("id", "title", "uploader")
-        }
+        },
+        # Full extract_info result, reused by downloads instead of re-extracting
+        "info": info,
     }
 
 
+def fetch_caption_track(
+    info: dict,
+    lang: str,
+    kind: str = "automatic_captions",
+    ext: str = "vtt"
+) -> Optional[str]:
+    """
+    Fetch a caption track straight from its URL in an extract_info result.
+
+    kind is "automatic_captions" or "subtitles". Returns the caption text, or
+    None if the track is missing or the request fails. Nothing touches disk.
+    """
+    tracks = (info.get(kind) or {}).get(lang) or []
+    track = next((t for t in tracks if t.get("ext") == ext and t.get("url")), None)
+    if not track:
+        return None
+
+    try:
+        with YoutubeDL({
+            "quiet": True,
+            "no_warnings": True,
+            "cookiefile": str(COOKIES_FILE),
+        }) as ydl:
+            data = ydl.urlopen(track["url"]).read()
+    except Exception as e:
+        print(f"Warning: Caption fetch failed for lang={lang} ({kind}): {e}")
+        return None
+
+    text = data.decode("utf-8", errors="ignore")
+    return text if text.strip() else None
+
+
+def fetch_caption_text(
+    info: dict,
+    lang: str,
+    kind: str = "automatic_captions",
+    formats: List[str] = CAPTION_FORMATS
+) -> Optional[Tuple[str, str]]:
+    """Fetch the first available track among formats; returns (caption_text, format) or None."""
+    for ext in formats:
+        text = fetch_caption_track(info, lang, kind, ext)
+        if text:
+            return text, ext
+    return None
+
+
 def download_auto_caption(
     url: str,
     video_id: str,
     lang: str = "en",
     player_client: Optional[str] = None,
     out_dir: Path = OUT_DIR,
-    wait_after: float = 0.25
+    wait_after: float = 0.25,
+    info: Optional[dict] = None,
+    automatic: bool = True
 ) -> Optional[str]:
-    """Download automatic captions for given language."""
+    """
+    Download captions for given language to out_dir and return the file path.
+
+    automatic selects auto captions (True) or manual subtitles (False).
+    If info is given, the captions are downloaded from it without
+    re-extracting; it must come from the same player_client (inspect_metadata
+    info for the default client).
+    """
+    out_dir.mkdir(parents=True, exist_ok=True)
     opts = {
         "skip_download": True,
         "outtmpl": str(out_dir / "%(id)s.%(ext)s"),
         "quiet": True,
         "no_warnings": True,
-        "writesubtitles": False,
-        "writeautomaticsub": True,
+        "writesubtitles": not automatic,
+        "writeautomaticsub": automatic,
         "subtitleslangs": [lang] if lang else None,
         "subtitlesformat": "vtt",
-        "cookiefile": str(COOKIES_FILE),   # 🔹 use cookies for auto captions
+        "cookiefile": str(COOKIES_FILE),   # 🔹 use cookies for caption downloads
     }
     
     if player_client:
@@ -67,7 +153,10 @@ def download_auto_caption(
     
     try:
         with YoutubeDL(opts) as ydl:
-            ydl.download([url])
+            if info is not None:
+                ydl.process_ie_result(copy.deepcopy(info), download=True)
+            else:
+                ydl.download([url])
     except Exception as e:
         print(f"Warning: Download failed for lang={lang}, client={player_client}: {e}")
         # You could optionally detect 429 here and bubble it up
@@ -81,29 +170,15 @@ def download_auto_caption(
         print("Warning: Could not determine video ID")
         return None
 
-    # Look for downloaded files
-    candidates = []
+    # Look for downloaded files (yt-dlp names them <id>.<lang>.<ext>)
     for ext in ("vtt", "srt"):
-        candidates.append(out_dir / f"{vid}.{ext}")
-
-    lang_safe = lang.replace("-", "_") if lang else ""
-    if lang_safe:
-        for ext in ("vtt", "srt"):
-            candidates.append(out_dir / f"{vid}.{lang_safe}.{ext}")
-            candidates.append(out_dir / f"{vid}.{lang}.{ext}")
-            for suffix in ("web_html5", "web", "desktop", "android", "ios", "tv_html5"):
-                candidates.append(out_dir / f"{vid}.{lang_safe}.{suffix}.{ext}")
-                candidates.append(out_dir / f"{vid}.{lang}.{suffix}.{ext}")
-
-    for p in candidates:
+        p = out_dir / f"{vid}.{lang}.{ext}"
         if p.exists():
             print(f"Found caption file: {p}")
             return str(p)
 
-    # Try glob patterns
-    glob_patterns = [f"{vid}*.vtt", f"{vid}*.srt", f"{vid}-*.vtt", f"{vid}-*.srt"]
-    for pat in glob_patterns:
-        found = list(out_dir.glob(pat))
+    for pat in (f"{vid}*.vtt", f"{vid}*.srt"):
+        found = sorted(out_dir.glob(pat))
         if found:
             print(f"Found caption file via glob: {found[0]}")
             return str(found[0])
@@ -112,17 +187,216 @@ def download_auto_caption(
     return None
 
 
+def _download_caption_text(
+    url: str,
+    video_id: str,
+    lang: str,
+    player_client: Optional[str] = None,
+    info: Optional[dict] = None,
+    automatic: bool = True
+) -> Optional[str]:
+    """Fallback: let yt-dlp download into a private scratch dir and read the text back."""
+    with tempfile.TemporaryDirectory(dir=OUT_DIR, prefix=f"{video_id}.") as scratch:
+        path = download_auto_caption(
+            url,
+            video_id=video_id,
+            lang=lang,
+            player_client=player_client,
+            out_dir=Path(scratch),
+            info=info,
+            automatic=automatic,
+        )
+        if not path:
+            return None
+        return Path(path).read_text(encoding="utf-8", errors="ignore")
+
+
+def _extract_info_for_client(url: str, player_client: str) -> Optional[dict]:
+    """Run extract_info with a specific YouTube player client."""
+    try:
+        with YoutubeDL({
+            "quiet": True,
+            "no_warnings": True,
+            "cookiefile": str(COOKIES_FILE),
+            "extractor_args": {"youtube": f"player_client={player_client}"},
+        }) as ydl:
+            return ydl.extract_info(url, download=False)
+    except Exception as e:
+        print(f"Warning: extract_info failed for client={player_client}: {e}")
+        return None
+
+
+def fetch_auto_caption(
+    url: str,
+    video_id: str,
+    lang: str,
+    player_client: Optional[str] = None,
+    info: Optional[dict] = None
+) -> Optional[Tuple[str, str]]:
+    """
+    Fetch automatic captions for one player client into memory.
+
+    Returns (caption_text, format), preferring json3 over VTT. The default
+    client reuses the inspect_metadata info; other clients need their own
+    extraction, and a client whose extraction fails is given up on. If the
+    info has no direct caption URL, that same info is handed to a scratch-dir
+    VTT download, so no client is ever extracted twice.
+    """
+    if player_client:
+        source_info = _extract_info_for_client(url, player_client)
+        if source_info is None:
+            return None
+    else:
+        source_info = info
+
+    if source_info is not None:
+        fetched = fetch_caption_text(source_info, lang, "automatic_captions")
+        if fetched:
+            return fetched
+
+    text = _download_caption_text(url, video_id, lang, player_client=player_client, info=source_info)
+    return (text, "vtt") if text else None
+
+
+def race_player_clients(
+    url: str,
+    video_id: str,
+    lang: str,
+    clients: List[Optional[str]],
+    info: Optional[dict] = None,
+    max_workers: int = YOUTUBE_CLIENT_RACE_WORKERS
+) -> Optional[Tuple[str, str, str]]:
+    """
+    Try several player clients and return (caption_text, format, client_label)
+    for the first one that yields captions, or None.
+
+    The default client (None) goes first on its own: it reuses the
+    inspect_metadata info and a direct caption URL, so it costs no extra
+    extraction and usually succeeds. Only if it fails are the player_client
+    overrides raced concurrently, each needing its own extract_info call.
+    Captions are fetched into memory, so attempts cannot clobber each other;
+    attempts that have not started yet are cancelled once one wins.
+    """
+    if None in clients:
+        try:
+            fetched = fetch_auto_caption(url, video_id=video_id, lang=lang, player_client=None, info=info)
+        except Exception as e:
+            print(f"  player_client=default failed: {e}")
+            fetched = None
+        if fetched:
+            print(f"  player_client=default SUCCESS ({fetched[1]})")
+            return fetched[0], fetched[1], "default"
+        print("  player_client=default not found")
+
+    overrides = [c for c in clients if c]
+    if not overrides:
+        return None
+
+    pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="yt-client")
+    futures = {}
+    for client in overrides:
+        futures[pool.submit(
+            fetch_auto_caption,
+            url,
+            video_id=video_id,
+            lang=lang,
+            player_client=client,
+            info=info,
+        )] = client
+
+    try:
+        for future in as_completed(futures):
+            label = futures[future]
+            try:
+                fetched = future.result()
+            except Exception as e:
+                print(f"  player_client={label} failed: {e}")
+                continue
+            if fetched:
+                print(f"  player_client={label} SUCCESS ({fetched[1]})")
+                return fetched[0], fetched[1], label
+            print(f"  player_client={label} not found")
+        return None
+    finally:
+        # Don't wait for losing attempts; they hold no shared state
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _cached_transcript(video_id: str, preferred_langs: List[str]) -> Optional[dict]:
+    """Look up (video_id, lang, type) in the transcript cache, auto captions first."""
+    for caption_type in ("auto", "manual"):
+        for lang in preferred_langs:
+            hit = get_transcript(video_id, lang, caption_type)
+            if hit:
+                return {
+                    "status": "ok",
+                    "type": caption_type,
+                    "lang": lang,
+                    "raw_caption": hit["raw_text"],
+                    "caption_format": hit["caption_format"],
+                    "text": "\n".join(hit["paragraphs"]),
+                    "paragraphs": hit["paragraphs"],
+                    "paragraph_starts": hit["paragraph_starts"],
+                    "id": video_id,
+                    "from_cache": True,
+                }
+    return None
+
+
+def _caption_result(
+    video_id: str,
+    lang: str,
+    caption_type: str,
+    caption_text: str,
+    caption_format: str = "vtt",
+    **extra
+) -> dict:
+    """Parse in-memory caption text once, store it in the transcript cache and build the result."""
+    dedup = {}
+    timed = clean_caption_text_to_paragraphs(caption_text, caption_format, stats=dedup)
+    paragraphs = [p for _, p in timed]
+    paragraph_starts = [start for start, _ in timed]
+    put_transcript(video_id, lang, caption_type, caption_text, paragraphs, paragraph_starts, caption_format)
+    return {
+        "status": "ok",
+        "type": caption_type,
+        "lang": lang,
+        **extra,
+        "raw_caption": caption_text,
+        "caption_format": caption_format,
+        "text": "\n".join(paragraphs),
+        "paragraphs": paragraphs,
+        # Start time (seconds) of each paragraph, None where unknown
+        "paragraph_starts": paragraph_starts,
+        # Rolling-caption de-dup word counts (words_raw / words_in / words_out)
+        "dedup": dedup,
+        "id": video_id,
+        "from_cache": False,
+    }
+
+
 def fetch_youtube_transcript(
     url: str,
     preferred_langs: Optional[List[str]] = None,
     max_clients_try: int = MAX_CLIENTS_TRY
 ) -> dict:
-    """Fetch YouTube transcript with automatic or manual captions."""
+    """
+    Fetch YouTube transcript with automatic or manual captions.
+
+    Captions are fetched into memory, json3 first with VTT as fallback; the
+    result carries the raw caption text ("raw_caption", "caption_format"),
+    its plain text and the cleaned paragraphs with their start times.
+    """
     if preferred_langs is None:
         preferred_langs = DEFAULT_LANGUAGES
     
     print(f"Fetching transcript for URL: {url}")
     print(f"Preferred languages: {preferred_langs}")
+
+    # Serve from the transcript cache without touching the network
+    cached = _cached_transcript(extract_video_id(url), preferred_langs)
+    if cached:
+        return cached
     
     try:
         meta = inspect_metadata(url)
@@ -148,36 +422,22 @@ def fetch_youtube_transcript(
 
     print(f"Languages that will actually be tried: {ordered}")
 
-    clients = YOUTUBE_CLIENTS
+    clients = YOUTUBE_CLIENTS[:max_clients_try]
     
-    # Try automatic captions
+    # Try automatic captions, racing player clients for each language
     for lang in ordered:
-        print(f"\nTrying language: {lang}")
-        for client in clients[:max_clients_try]:
-            client_label = client or "default"
-            print(f"  Trying player_client={client_label}...", end=" ")
-            
-            # ✅ pass video_id to avoid extra extract_info calls
-            path = download_auto_caption(url, video_id=vid, lang=lang, player_client=client)
-            if path:
-                print("SUCCESS")
-                from youtube.vtt_processor import vtt_to_plaintext
-                try:
-                    text = vtt_to_plaintext(path)
-                    return {
-                        "status": "ok",
-                        "type": "auto",
-                        "lang": lang,
-                        "player_client": client_label,
-                        "file": path,
-                        "text": text,
-                        "id": vid
-                    }
-                except Exception as e:
-                    print(f"Error converting VTT to text: {e}")
-                    continue
-            else:
-                print("not found")
+        print(f"\nTrying language: {lang} with player clients {[c or 'default' for c in clients]}")
+        # ✅ pass video_id and the metadata info to avoid extra extract_info calls
+        won = race_player_clients(url, vid, lang, clients, info=meta["info"])
+        if won:
+            caption_text, caption_format, client_label = won
+            try:
+                return _caption_result(
+                    vid, lang, "auto", caption_text, caption_format, player_client=client_label
+                )
+            except Exception as e:
+                print(f"Error converting {caption_format} captions to text: {e}")
+                continue
 
     # Try manual subtitles as fallback
     if meta["manual"]:
@@ -191,63 +451,24 @@ def fetch_youtube_transcript(
             tried.add(lang_try)
             
             print(f"Trying manual subtitle: {lang_try}")
-            
-            opts = {
-                "skip_download": True,
-                "outtmpl": str(OUT_DIR / "%(id)s.%(ext)s"),
-                "quiet": True,
-                "no_warnings": True,
-                "writesubtitles": True,
-                "writeautomaticsub": False,
-                "subtitleslangs": [lang_try],
-                "subtitlesformat": "vtt",
-                "cookiefile": str(COOKIES_FILE),   # 🔹 use cookies for manual subs too
-            }
-            
+
+            # Reuse the metadata extracted above instead of re-extracting
+            fetched = fetch_caption_text(meta["info"], lang_try, "subtitles")
+            if not fetched:
+                vtt_text = _download_caption_text(
+                    url, vid, lang_try, info=meta["info"], automatic=False
+                )
+                fetched = (vtt_text, "vtt") if vtt_text else None
+            if not fetched:
+                print(f"Manual subtitle download failed for {lang_try}")
+                continue
+
+            caption_text, caption_format = fetched
             try:
-                with YoutubeDL(opts) as ydl:
-                    ydl.download([url])
+                return _caption_result(vid, lang_try, "manual", caption_text, caption_format)
             except Exception as e:
-                print(f"Manual subtitle download failed: {e}")
+                print(f"Error converting manual {caption_format} captions to text: {e}")
                 continue
-            
-            from youtube.vtt_processor import vtt_to_plaintext
-            
-            # Check for downloaded files
-            for ext in ("vtt", "srt"):
-                p = OUT_DIR / f"{vid}.{lang_try}.{ext}"
-                if p.exists():
-                    try:
-                        text = vtt_to_plaintext(str(p))
-                        return {
-                            "status": "ok",
-                            "type": "manual",
-                            "lang": lang_try,
-                            "file": str(p),
-                            "text": text,
-                            "id": vid
-                        }
-                    except Exception as e:
-                        print(f"Error converting manual VTT to text: {e}")
-                        continue
-            
-            # Check base filename
-            for ext in ("vtt", "srt"):
-                p2 = OUT_DIR / f"{vid}.{ext}"
-                if p2.exists():
-                    try:
-                        text = vtt_to_plaintext(str(p2))
-                        return {
-                            "status": "ok",
-                            "type": "manual",
-                            "lang": lang_try,
-                            "file": str(p2),
-                            "text": text,
-                            "id": vid
-                        }
-                    except Exception as e:
-                        print(f"Error converting manual VTT to text: {e}")
-                        continue
     
     return {
         "status": "none",